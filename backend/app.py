@@ -1,17 +1,27 @@
 # backend/app.py
 
+import os
+import json
+import time
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 
 import load_env   # <-- load all environment keys
 
-from reasoner import run_reasoning_layer
-from search import MemorySearchEngine
+from reasoner import run_reasoning_layer, stream_reasoning_layer
 from orchestrator import orchestrator   # <-- already includes all providers
-from llm import normalize_query_with_llm
+from llm import normalize_query_with_llm, llm_flights
 from models import SearchItem
+from vector_memory import vector_store
+from vector_memory.ingest import ingest_queue
+from embeddings import embedding_cache, model_stats, warm_up
+from semantic_cache import semantic_cache
+from providers.transport import transport as http_transport
+from cache import codec as cache_codec, redis_stats, aclose as close_redis
 
 
 app = FastAPI()
@@ -27,6 +37,29 @@ app.add_middleware(
 )
 
 
+# ---------------- Startup ----------------
+@app.on_event("startup")
+async def startup():
+    # Load the shared embedding model before the first request arrives
+    if os.getenv("EMBED_WARMUP", "1") == "1":
+        await asyncio.to_thread(warm_up)
+
+    # Open vector memory in this worker (not in a pre-fork master), then
+    # start background TTL / capacity enforcement
+    await asyncio.to_thread(vector_store.load)
+    vector_store.start_compactor()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Persist queued memory writes, then fold the write-ahead log into the
+    # index snapshot
+    await asyncio.to_thread(ingest_queue.drain)
+    vector_store.checkpoint()
+    await close_redis()
+    await http_transport.aclose()
+
+
 # ---------------- Request Model ----------------
 class SearchRequest(BaseModel):
     query: str
@@ -35,32 +68,42 @@ class SearchRequest(BaseModel):
     use_llm: bool = False
 
 
-# ---------------- Search Endpoint ----------------
-@app.post("/search")
-async def search(req: SearchRequest):
-
+# ---------------- Shared Steps ----------------
+async def effective_query_for(req: SearchRequest):
+    """Returns (effective_query, llm_debug)."""
     effective_query = req.query
     llm_debug = None
 
     # ---- Optional LLM Query Normalization ----
     if req.use_llm:
         try:
-            normalized, debug = normalize_query_with_llm(req.query, req.domains)
+            # Blocking Gemini + Redis calls: keep them off the event loop
+            normalized, debug = await asyncio.to_thread(normalize_query_with_llm, req.query, req.domains)
             if normalized.strip():
                 effective_query = normalized.strip()
             llm_debug = debug
         except Exception as e:
             llm_debug = f"LLM normalization failed: {e}"
 
-    # ---- Run orchestrator over all providers ----
-    final_results: List[SearchItem] = orchestrator.search(
+    return effective_query, llm_debug
+
+
+# ---------------- Search Endpoint ----------------
+@app.post("/search")
+async def search(req: SearchRequest):
+
+    effective_query, llm_debug = await effective_query_for(req)
+
+    # ---- Run orchestrator over all providers (concurrently) ----
+    final_results: List[SearchItem]
+    final_results, search_stats = await orchestrator.search_async(
         query=effective_query,
         domains=req.domains,
         num_results=req.num_results
     )
 
     # ---- LLM Reasoning (Gemini) ----
-    ai_analysis = run_reasoning_layer(effective_query, final_results)
+    ai_analysis = await run_reasoning_layer(effective_query, final_results)
 
     # ---- Final Response ----
     return {
@@ -69,6 +112,83 @@ async def search(req: SearchRequest):
         "citations": ai_analysis["citations"],
         "effective_query": effective_query,
         "providers_used": list({r.provider for r in final_results}),
+        "provider_stats": search_stats.get("providers", {}),
+        "search_stats": search_stats,
+        "reasoning_stats": ai_analysis.get("trace"),
         "llm_used": req.use_llm,
         "llm_debug": llm_debug
     }
+
+
+# ---------------- Streaming Search Endpoint ----------------
+@app.post("/search/stream")
+async def search_stream(req: SearchRequest):
+    """
+    Same pipeline as /search, as newline-delimited JSON events:
+      {"event": "results", ...}      ranked results, as soon as ranking is done
+      {"event": "agent_step", ...}   one per agentic planner/subquery step
+      {"event": "token", "text"}     answer chunks as Gemini generates them
+      {"event": "done", ...}         citations + reasoning stats
+    """
+
+    async def events():
+        start = time.perf_counter()
+        effective_query, llm_debug = await effective_query_for(req)
+
+        final_results: List[SearchItem]
+        final_results, search_stats = await orchestrator.search_async(
+            query=effective_query,
+            domains=req.domains,
+            num_results=req.num_results
+        )
+        # Copy: coalesced requests share the leader's stats dict
+        search_stats = dict(search_stats, results_ms=round((time.perf_counter() - start) * 1000, 1))
+
+        yield json.dumps({
+            "event": "results",
+            "results": [r.dict() for r in final_results],
+            "effective_query": effective_query,
+            "providers_used": list({r.provider for r in final_results}),
+            "search_stats": search_stats,
+            "llm_used": req.use_llm,
+            "llm_debug": llm_debug
+        }) + "\n"
+
+        async for event in stream_reasoning_layer(effective_query, final_results):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------- Provider Health Endpoint ----------------
+@app.get("/providers/health")
+async def providers_health():
+    return {
+        "providers": orchestrator.health.stats(),
+        "configured": [p.name for p in orchestrator.providers],
+        "provider_timeout": orchestrator.provider_timeout,
+        "deadline": orchestrator.deadline,
+    }
+
+
+# ---------------- Metrics Endpoint ----------------
+@app.get("/metrics")
+async def metrics():
+    return {
+        "embedding_model": model_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "memory_policy": orchestrator.memory_policy.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "cache_codec": cache_codec.stats(),
+        "redis": redis_stats(),
+        "result_cache": orchestrator.cache_stats(),
+        "memory_ingest": ingest_queue.stats(),
+        "singleflight": {
+            "orchestrator": orchestrator.flights.stats(),
+            "llm_norm": llm_flights.stats(),
+        },
+    }
@@ -1,24 +1,284 @@
 import os
+import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional
+
 import redis
-import pickle
+import redis.asyncio as aredis
+import msgpack
+
+from circuit_breaker import CircuitBreaker
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
 
 REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB   = int(os.getenv("REDIS_DB", 0))
 
-r = redis.StrictRedis(
+# zstd | lz4 | none; falls back to none if the library isn't installed
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zstd")
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+
+# The cache is an optimization: keep timeouts short so a slow Redis costs a
+# few hundred ms at worst, and stop calling it for a while after failures.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 32))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 0.2))        # wait for a free connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.25))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.25))
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", 3))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", 30))
+
+_pool_kwargs = dict(
     host=REDIS_HOST,
     port=REDIS_PORT,
     db=REDIS_DB,
-    decode_responses=False
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    decode_responses=False,
 )
 
+# Blocking client, for code running in worker threads
+r = redis.StrictRedis(connection_pool=redis.BlockingConnectionPool(**_pool_kwargs))
+
+# asyncio client, for request handlers
+ar = aredis.Redis(connection_pool=aredis.BlockingConnectionPool(**_pool_kwargs))
+
+# Shared by both clients: they talk to the same server
+breaker = CircuitBreaker("redis", REDIS_BREAKER_FAILURES, REDIS_BREAKER_COOLDOWN)
+
+REDIS_ERRORS = (redis.RedisError, OSError)
+
 def make_key(*parts):
     return ":".join([str(p) for p in parts])
 
+
+# ---------------- Codec ----------------
+# Every stored value starts with one header byte:
+#   high nibble = format version, low nibble = compression id.
+# Anything else (e.g. legacy pickle entries) is treated as a cache miss and
+# is never unpickled.
+
+FORMAT_VERSION = 1
+
+COMPRESS_NONE = 0
+COMPRESS_ZSTD = 1
+COMPRESS_LZ4 = 2
+
+
+class CacheCodec:
+    """msgpack payloads with optional zstd/lz4 compression above a size threshold."""
+
+    def __init__(self, compression: str = CACHE_COMPRESSION, min_bytes: int = CACHE_COMPRESS_MIN_BYTES):
+        self.min_bytes = min_bytes
+        self.compression = COMPRESS_NONE
+        if compression == "zstd" and zstandard is not None:
+            self.compression = COMPRESS_ZSTD
+        elif compression == "lz4" and lz4_frame is not None:
+            self.compression = COMPRESS_LZ4
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "encoded": 0,
+            "decoded": 0,
+            "rejected": 0,
+            "encode_seconds": 0.0,
+            "decode_seconds": 0.0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+        }
+
+    def _compress(self, data: bytes):
+        if self.compression == COMPRESS_NONE or len(data) < self.min_bytes:
+            return COMPRESS_NONE, data
+        if self.compression == COMPRESS_ZSTD:
+            return COMPRESS_ZSTD, zstandard.ZstdCompressor(level=3).compress(data)
+        return COMPRESS_LZ4, lz4_frame.compress(data)
+
+    @staticmethod
+    def _decompress(method: int, data: bytes) -> bytes:
+        if method == COMPRESS_NONE:
+            return data
+        if method == COMPRESS_ZSTD and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+        if method == COMPRESS_LZ4 and lz4_frame is not None:
+            return lz4_frame.decompress(data)
+        raise ValueError(f"unsupported compression id {method}")
+
+    def encode(self, value) -> bytes:
+        start = time.perf_counter()
+        raw = msgpack.packb(value, use_bin_type=True)
+        method, body = self._compress(raw)
+        out = bytes([(FORMAT_VERSION << 4) | method]) + body
+
+        with self._lock:
+            self._stats["encoded"] += 1
+            self._stats["encode_seconds"] += time.perf_counter() - start
+            self._stats["raw_bytes"] += len(raw)
+            self._stats["stored_bytes"] += len(out)
+        return out
+
+    def decode(self, data: bytes):
+        """Returns the value, or None for entries this codec can't read."""
+        start = time.perf_counter()
+        header = data[0] if data else 0
+
+        if header >> 4 != FORMAT_VERSION:
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None
+
+        try:
+            value = msgpack.unpackb(self._decompress(header & 0x0F, data[1:]), raw=False)
+        except Exception as e:
+            print(f"[cache] undecodable entry: {e!r}")
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None
+
+        with self._lock:
+            self._stats["decoded"] += 1
+            self._stats["decode_seconds"] += time.perf_counter() - start
+        return value
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s["compression"] = {COMPRESS_NONE: "none", COMPRESS_ZSTD: "zstd", COMPRESS_LZ4: "lz4"}[self.compression]
+        s["avg_encode_ms"] = round(s["encode_seconds"] * 1000 / max(s["encoded"], 1), 4)
+        s["avg_decode_ms"] = round(s["decode_seconds"] * 1000 / max(s["decoded"], 1), 4)
+        s["compression_ratio"] = round(s["stored_bytes"] / max(s["raw_bytes"], 1), 4)
+        return s
+
+
+codec = CacheCodec()
+
+
+# ---------------- Guarded calls ----------------
+# Every Redis call goes through the breaker. Errors are logged and turned into
+# the default (a miss for reads, a no-op for writes), never raised.
+
+def _call(op, default=None):
+    if not breaker.allow():
+        return default
+    try:
+        out = op()
+    except REDIS_ERRORS as e:
+        breaker.record_failure()
+        print(f"[cache] redis unavailable: {e!r}")
+        return default
+    except BaseException:
+        breaker.release()   # no verdict on Redis; don't hold a half-open trial
+        raise
+    breaker.record_success()
+    return out
+
+
+async def _acall(op, default=None):
+    if not breaker.allow():
+        return default
+    try:
+        out = await op()
+    except REDIS_ERRORS as e:
+        breaker.record_failure()
+        print(f"[cache] redis unavailable: {e!r}")
+        return default
+    except BaseException:
+        breaker.release()   # e.g. CancelledError from a dropped subquery
+        raise
+    breaker.record_success()
+    return out
+
+
+# ---------------- Raw bytes (blocking) ----------------
+
+def get_raw_many(keys: List[str]) -> List[Optional[bytes]]:
+    if not keys:
+        return []
+    return _call(lambda: r.mget(keys), [None] * len(keys))
+
+def set_raw_many(mapping: Dict[str, bytes], ttl_seconds: int):
+    if not mapping:
+        return
+
+    def op():
+        pipe = r.pipeline(transaction=False)
+        for k, v in mapping.items():
+            pipe.set(k, v, ex=ttl_seconds)
+        pipe.execute()
+
+    _call(op)
+
+
+# ---------------- Values (blocking) ----------------
+
 def set_cache(key, value, ttl_seconds=3600):
-    r.set(key, pickle.dumps(value), ex=ttl_seconds)
+    data = codec.encode(value)
+    _call(lambda: r.set(key, data, ex=ttl_seconds))
 
 def get_cache(key):
-    raw = r.get(key)
-    return pickle.loads(raw) if raw else None
+    raw = _call(lambda: r.get(key))
+    return codec.decode(raw) if raw else None
+
+
+# ---------------- asyncio ----------------
+
+async def aget_cache(key):
+    raw = await _acall(lambda: ar.get(key))
+    return codec.decode(raw) if raw else None
+
+async def aclose():
+    await ar.connection_pool.disconnect()
+
+
+# ---------------- Short-lived locks ----------------
+# SET NX PX with a random token; release only deletes our own token. When Redis
+# is unavailable the lock "succeeds", so callers fall back to doing the work.
+
+_UNLOCK_LUA = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def try_lock(key: str, ttl_seconds: float) -> Optional[str]:
+    """Returns a release token, or None if another holder has the lock."""
+    token = uuid.uuid4().hex
+    ok = _call(lambda: r.set(key, token, nx=True, px=int(ttl_seconds * 1000)), True)
+    return token if ok else None
+
+def unlock(key: str, token: str):
+    _call(lambda: r.eval(_UNLOCK_LUA, 1, key, token))
+
+def is_locked(key: str) -> bool:
+    return bool(_call(lambda: r.exists(key), 0))
+
+async def atry_lock(key: str, ttl_seconds: float) -> Optional[str]:
+    token = uuid.uuid4().hex
+    ok = await _acall(lambda: ar.set(key, token, nx=True, px=int(ttl_seconds * 1000)), True)
+    return token if ok else None
+
+async def aunlock(key: str, token: str):
+    await _acall(lambda: ar.eval(_UNLOCK_LUA, 1, key, token))
+
+async def ais_locked(key: str) -> bool:
+    return bool(await _acall(lambda: ar.exists(key), 0))
+
+
+def redis_stats() -> Dict[str, Any]:
+    return {
+        "breaker": breaker.stats(),
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    }
@@ -0,0 +1,74 @@
+# backend/cache_policy.py
+"""
+Freshness policy for cached orchestrator results.
+
+Each query is put in a class with its own fresh TTL:
+  - "recent":    news / live / dated queries ("latest", "today", "2026 ...")
+  - "evergreen": definitions, how-tos, history
+  - "default":   everything else
+
+After the fresh TTL, an entry stays in Redis for RESULT_STALE_TTL more seconds
+and is served stale while a background refresh replaces it. Empty results are
+cached for RESULT_NEGATIVE_TTL only, without a stale window. Results from a
+degraded fan-out (a provider failed, timed out or was skipped) are fresh for
+RESULT_DEGRADED_TTL at most, so a partial answer is soon refreshed. A
+background refresh that comes back empty keeps the stale entry and marks it
+fresh for RESULT_DEGRADED_TTL, so the next hits don't retry right away.
+"""
+
+import os
+import re
+import time
+from typing import Dict
+
+from ranking import parse_weights
+
+RESULT_TTLS = parse_weights(
+    os.getenv("RESULT_TTLS", ""),
+    {"recent": 15 * 60, "default": 6 * 3600, "evergreen": 7 * 24 * 3600},
+)
+RESULT_STALE_TTL = int(os.getenv("RESULT_STALE_TTL", 24 * 3600))   # 0 = no stale serving
+RESULT_NEGATIVE_TTL = int(os.getenv("RESULT_NEGATIVE_TTL", 60))
+RESULT_DEGRADED_TTL = int(os.getenv("RESULT_DEGRADED_TTL", 60))
+
+QUERY_CLASS_RECENT = "recent"
+QUERY_CLASS_DEFAULT = "default"
+QUERY_CLASS_EVERGREEN = "evergreen"
+
+RECENT_RE = re.compile(
+    r"\b(today|tonight|yesterday|now|latest|breaking|live|news|this (week|month|year)|"
+    r"current|currently|score|scores|update|updates|trending|just|announced)\b"
+)
+EVERGREEN_RE = re.compile(
+    r"^(what is|what are|who was|how to|how do|how does|why do|why does|define|definition|explain)\b|"
+    r"\b(history of|meaning of|tutorial|guide)\b"
+)
+YEAR_RE = re.compile(r"\b(19|20)\d\d\b")
+
+
+def classify_query(query: str) -> str:
+    q = query.lower().strip()
+
+    # A mention of this year or last year is about recent events
+    this_year = time.gmtime().tm_year
+    years = {int(m.group(0)) for m in YEAR_RE.finditer(q)}
+    if RECENT_RE.search(q) or any(y >= this_year - 1 for y in years):
+        return QUERY_CLASS_RECENT
+    if EVERGREEN_RE.search(q):
+        return QUERY_CLASS_EVERGREEN
+    return QUERY_CLASS_DEFAULT
+
+
+def result_ttls(query: str, has_results: bool, degraded: bool = False) -> Dict[str, float]:
+    """
+    Returns {"class", "fresh", "expire"}: seconds until the entry goes stale,
+    and until Redis drops it.
+    """
+    if not has_results:
+        return {"class": "negative", "fresh": RESULT_NEGATIVE_TTL, "expire": RESULT_NEGATIVE_TTL}
+
+    cls = classify_query(query)
+    fresh = RESULT_TTLS.get(cls, RESULT_TTLS[QUERY_CLASS_DEFAULT])
+    if degraded:
+        cls, fresh = "degraded", min(fresh, RESULT_DEGRADED_TTL)
+    return {"class": cls, "fresh": fresh, "expire": fresh + RESULT_STALE_TTL}
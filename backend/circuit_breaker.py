@@ -0,0 +1,91 @@
+# backend/circuit_breaker.py
+"""
+Minimal circuit breaker for optional dependencies (Redis, providers).
+
+closed    -> calls go through; `failure_threshold` consecutive failures open it
+open      -> calls are skipped until `cooldown` seconds have passed
+half_open -> one trial call is let through; success closes, failure re-opens.
+             A trial that never reports back (e.g. cancelled) is given up
+             after `cooldown` seconds, or earlier via release().
+"""
+
+import time
+import threading
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+        self.opens = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._trial = False
+            now = time.monotonic()
+            if self.state == HALF_OPEN and (not self._trial or now - self._trial_at >= self.cooldown):
+                self._trial = True
+                self._trial_at = now
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                    print(f"[breaker] {self.name} open for {self.cooldown:.0f}s")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def release(self):
+        """Give back a half-open trial whose call ended without a verdict."""
+        with self._lock:
+            self._trial = False
+
+    def trip(self):
+        """Open immediately, e.g. on a quota / rate-limit signal."""
+        with self._lock:
+            if self.state != OPEN:
+                self.opens += 1
+                print(f"[breaker] {self.name} tripped for {self.cooldown:.0f}s")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._trial = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opens": self.opens,
+                "short_circuited": self.short_circuited,
+            }
@@ -0,0 +1,315 @@
+# backend/embeddings.py
+"""
+Batched embedding service shared by ranking, the orchestrator and memory search.
+
+All texts of a request are encoded in a single SentenceTransformer.encode call.
+With EMBED_MICRO_BATCH=1, concurrent callers (e.g. several requests ranking in
+worker threads) are merged into shared forward passes by a background thread.
+
+Vectors are cached by sha256(model name + normalized text) in an in-process
+LRU bounded by bytes and, with EMBED_CACHE_REDIS=1, in the shared Redis.
+
+The model itself is loaded once per process by get_embedding_service(), on
+first use or from the app's startup hook. With EMBED_PRELOAD=1 it is loaded at
+import time instead, so a pre-forking server (gunicorn --preload) loads it in
+the master and workers share its pages copy-on-write.
+"""
+
+import os
+import re
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBED_PRELOAD = os.getenv("EMBED_PRELOAD", "0") == "1"
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+EMBED_MICRO_BATCH = os.getenv("EMBED_MICRO_BATCH", "0") == "1"
+EMBED_MICRO_BATCH_WAIT_MS = float(os.getenv("EMBED_MICRO_BATCH_WAIT_MS", 5))
+
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+EMBED_CACHE_REDIS = os.getenv("EMBED_CACHE_REDIS", "0") == "1"
+EMBED_CACHE_REDIS_TTL = int(os.getenv("EMBED_CACHE_REDIS_TTL", 7 * 24 * 3600))
+
+
+# ---------------- Embedding cache ----------------
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed vector cache. Values are raw float32 bytes in both tiers,
+    so a Redis entry can be read by any worker without unpickling.
+    """
+
+    def __init__(self, max_bytes: int = EMBED_CACHE_MAX_BYTES, use_redis: bool = EMBED_CACHE_REDIS):
+        self.max_bytes = max_bytes
+        self.use_redis = use_redis
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        digest = hashlib.sha256(f"{model_name}\x00{_normalize_text(text)}".encode("utf-8")).hexdigest()
+        return f"emb:{digest}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[bytes]] = [None] * len(keys)
+
+        # ---- Tier 1: in-process LRU ----
+        with self._lock:
+            for i, k in enumerate(keys):
+                raw = self._lru.get(k)
+                if raw is not None:
+                    self._lru.move_to_end(k)
+                    found[i] = raw
+                    self.hits += 1
+
+        # ---- Tier 2: shared Redis ----
+        missing = [i for i, raw in enumerate(found) if raw is None]
+        if missing and self.use_redis:
+            from cache import get_raw_many
+            values = get_raw_many([keys[i] for i in missing])   # all misses if Redis is down
+
+            redis_hits = 0
+            for i, raw in zip(missing, values):
+                if raw is not None:
+                    found[i] = raw
+                    redis_hits += 1
+                    self._put_local(keys[i], raw)
+            with self._lock:
+                self.redis_hits += redis_hits
+
+        misses = sum(1 for raw in found if raw is None)
+        with self._lock:
+            self.misses += misses
+        return [np.frombuffer(raw, dtype="float32") if raw is not None else None for raw in found]
+
+    def put_many(self, keys: List[str], vecs: np.ndarray):
+        payloads = [np.ascontiguousarray(v, dtype="float32").tobytes() for v in vecs]
+        for k, raw in zip(keys, payloads):
+            self._put_local(k, raw)
+
+        if self.use_redis and keys:
+            from cache import set_raw_many
+            set_raw_many(dict(zip(keys, payloads)), EMBED_CACHE_REDIS_TTL)
+
+    def _put_local(self, key: str, raw: bytes):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return
+            self._lru[key] = raw
+            self._bytes += len(raw)
+            while self._bytes > self.max_bytes and self._lru:
+                _, old = self._lru.popitem(last=False)
+                self._bytes -= len(old)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._lru),
+                "bytes": self._bytes,
+            }
+
+
+# Shared by every EmbeddingService in the process
+embedding_cache = EmbeddingCache()
+
+
+# ---------------- Embedding service ----------------
+
+class EmbeddingService:
+    def __init__(
+        self,
+        model,
+        model_name: str,
+        batch_size: int = EMBED_BATCH_SIZE,
+        micro_batch: bool = EMBED_MICRO_BATCH,
+        max_wait_ms: float = EMBED_MICRO_BATCH_WAIT_MS,
+    ):
+        self.model = model
+        self.model_name = model_name
+        self.cache: Optional[EmbeddingCache] = embedding_cache
+        self.batch_size = batch_size
+        self.micro_batch = micro_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.dim = model.get_sentence_embedding_dimension()
+
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    # ---------------- public API ----------------
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix, one row per input text.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype="float32")
+
+        if self.cache is None:
+            return self._compute(texts)
+
+        keys = [EmbeddingCache.key(self.model_name, t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        todo = []
+        for i, vec in enumerate(cached):
+            if vec is None:
+                todo.append(i)
+            else:
+                out[i] = vec
+
+        if todo:
+            fresh = self._compute([texts[i] for i in todo])
+            out[todo] = fresh
+            self.cache.put_many([keys[i] for i in todo], fresh)
+
+        return out
+
+    def _compute(self, texts: List[str]) -> np.ndarray:
+        if self.micro_batch:
+            return self._submit(texts).result()
+        return self._encode(texts)
+
+    # ---------------- encoding ----------------
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vecs = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        return np.asarray(vecs, dtype="float32")
+
+    # ---------------- micro-batching ----------------
+
+    def _submit(self, texts: List[str]) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((texts, fut))
+        return fut
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embed-micro-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            pending = len(jobs[0][0])
+
+            # Collect more work until the batch is full or the wait window closes
+            while pending < self.batch_size:
+                try:
+                    job = self._queue.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                pending += len(job[0])
+
+            merged = [t for texts, _ in jobs for t in texts]
+            try:
+                vecs = self._encode(merged)
+            except Exception as e:
+                for _, fut in jobs:
+                    fut.set_exception(e)
+                continue
+
+            offset = 0
+            for texts, fut in jobs:
+                fut.set_result(vecs[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+# ---------------- Process-wide model registry ----------------
+
+_services: Dict[str, EmbeddingService] = {}
+_registry_lock = threading.Lock()
+_model_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process (0 if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def get_embedding_service(model_name: str = EMBED_MODEL_NAME) -> EmbeddingService:
+    """
+    Return the shared EmbeddingService for model_name, loading the model on
+    first call. Safe to call from several threads.
+    """
+    service = _services.get(model_name)
+    if service is not None:
+        return service
+
+    with _registry_lock:
+        service = _services.get(model_name)
+        if service is None:
+            from sentence_transformers import SentenceTransformer
+
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            model = SentenceTransformer(model_name)
+            load_seconds = time.perf_counter() - start
+
+            service = EmbeddingService(model, model_name)
+            _services[model_name] = service
+            _model_stats[model_name] = {
+                "load_seconds": round(load_seconds, 3),
+                "rss_before_bytes": rss_before,
+                "rss_after_bytes": _rss_bytes(),
+                "loaded_in_pid": os.getpid(),
+            }
+            print(f"[embed] loaded {model_name} in {load_seconds:.2f}s")
+    return service
+
+
+def warm_up(model_name: str = EMBED_MODEL_NAME):
+    """Load the model and run one forward pass so the first request is not slow."""
+    get_embedding_service(model_name)._encode(["warm up"])
+
+
+def model_stats() -> Dict[str, object]:
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": _rss_bytes(),
+        "models": dict(_model_stats),
+    }
+
+
+if EMBED_PRELOAD:
+    get_embedding_service()
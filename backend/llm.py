@@ -1,6 +1,9 @@
 import os
 import load_env
 from cache import make_key, get_cache, set_cache
+from embeddings import get_embedding_service
+from semantic_cache import semantic_cache, SEMANTIC_CACHE_ENABLED
+from singleflight import SingleFlight
 from typing import List, Tuple, Optional
 import google.generativeai as genai
 
@@ -12,6 +15,9 @@ if not os.getenv("GEMINI_API_KEY"):
 # Configure Gemini client
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Coalesces identical in-flight normalizations (keyed by the cache key)
+llm_flights = SingleFlight("llm_norm")
+
 SYSTEM_PROMPT = """
 You are a search-query optimizer for a semantic social media memory search engine.
 
@@ -43,10 +49,33 @@ def normalize_query_with_llm(original_query: str, domains: Optional[List[str]] =
     # ---------- CACHE CHECK ----------
     cache_key = make_key("llm_norm", original_query, domains, 0, False)
     cached = get_cache(cache_key)
+
+    # Near-duplicate phrasing with the same platforms
+    semantic_scope = make_key("llm_norm", domains)
+    if not cached and SEMANTIC_CACHE_ENABLED:
+        query_vec = get_embedding_service().embed(original_query)
+        hit = semantic_cache.lookup(semantic_scope, query_vec)
+        if hit:
+            cached = get_cache(hit[0])
+
     if cached:
         return cached["normalized"], cached["debug"]
     # ---------------------------------
 
+    def peek():
+        hit = get_cache(cache_key)
+        return (hit["normalized"], hit["debug"]) if hit else None
+
+    return llm_flights.do(
+        cache_key,
+        lambda: _normalize_uncached(original_query, domains, cache_key, semantic_scope),
+        peek=peek,
+    )
+
+
+def _normalize_uncached(
+    original_query: str, domains: Optional[List[str]], cache_key: str, semantic_scope: str
+) -> Tuple[str, str]:
     model = genai.GenerativeModel("gemini-2.5-flash")
     domains_hint = build_domains_hint(domains)
 
@@ -79,6 +108,9 @@ Rewrite this into an optimized search query ONLY.
             "normalized": normalized,
             "debug": debug_info
         }, ttl_seconds=6 * 3600)
+
+        if SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(semantic_scope, get_embedding_service().embed(original_query), cache_key, 6 * 3600)
         # ------------------------------------
 
         return normalized, debug_info
@@ -0,0 +1,125 @@
+# backend/memory_policy.py
+"""
+Decides when vector-memory hits are good enough to answer a query without
+calling any provider.
+
+A hit qualifies when it is close enough (cosine or squared-L2 threshold, or a
+strong BM25 match), fresh enough, and within the requested domains. With at
+least MEMORY_MIN_HITS qualifying hits the query is served from memory; with
+fewer, qualifying hits are mixed into the provider results ("hybrid").
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+MEMORY_DISTANCE_METRIC = os.getenv("MEMORY_DISTANCE_METRIC", "cosine")   # cosine | l2
+MEMORY_MIN_COSINE = float(os.getenv("MEMORY_MIN_COSINE", 0.75))
+MEMORY_MAX_L2 = float(os.getenv("MEMORY_MAX_L2", 0.5))          # squared L2, as FAISS reports it
+MEMORY_MIN_BM25 = float(os.getenv("MEMORY_MIN_BM25", 10.0))     # 0 = lexical-only hits never qualify
+MEMORY_MIN_HITS = int(os.getenv("MEMORY_MIN_HITS", 3))
+MEMORY_MAX_AGE = int(os.getenv("MEMORY_MAX_AGE_SECONDS", 7 * 24 * 3600))  # 0 = no freshness check
+
+MODE_MEMORY = "memory"
+MODE_HYBRID = "hybrid"
+MODE_PROVIDERS = "providers"
+
+
+def cosine_from_l2(dist: float) -> float:
+    """
+    all-MiniLM-L6-v2 vectors are unit length, so squared L2 and cosine are
+    related by ||a - b||^2 = 2 - 2 cos(a, b).
+    """
+    return 1.0 - dist / 2.0
+
+
+def _domain_ok(url: str, domains: Optional[list]) -> bool:
+    if not domains:
+        return True
+    url = url.lower()
+    for d in domains:
+        clean_d = d.lower().replace("https://", "").replace("http://", "").replace("www.", "").strip("/")
+        if clean_d in url:
+            return True
+    return False
+
+
+class MemoryPolicy:
+    def __init__(
+        self,
+        metric: str = MEMORY_DISTANCE_METRIC,
+        min_cosine: float = MEMORY_MIN_COSINE,
+        max_l2: float = MEMORY_MAX_L2,
+        min_bm25: float = MEMORY_MIN_BM25,
+        min_hits: int = MEMORY_MIN_HITS,
+        max_age: int = MEMORY_MAX_AGE,
+    ):
+        if metric not in ("cosine", "l2"):
+            raise ValueError(f"Unknown memory distance metric {metric!r}")
+        self.metric = metric
+        self.min_cosine = min_cosine
+        self.max_l2 = max_l2
+        self.min_bm25 = min_bm25
+        self.min_hits = min_hits
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self.counters = {
+            "lookups": 0,
+            MODE_MEMORY: 0,
+            MODE_HYBRID: 0,
+            MODE_PROVIDERS: 0,
+            "provider_calls_avoided": 0,
+        }
+
+    # ---------------- decision ----------------
+
+    def qualifies(self, meta: Dict[str, Any], signals: Dict[str, Any], domains: Optional[list], now: int) -> bool:
+        if self.max_age and (meta.get("timestamp") or 0) < now - self.max_age:
+            return False
+        if not _domain_ok(meta.get("url", ""), domains):
+            return False
+
+        dist = signals.get("distance")
+        if dist is not None:
+            if self.metric == "cosine" and cosine_from_l2(dist) >= self.min_cosine:
+                return True
+            if self.metric == "l2" and dist <= self.max_l2:
+                return True
+
+        bm25 = signals.get("bm25")
+        return bool(self.min_bm25 and bm25 is not None and bm25 >= self.min_bm25)
+
+    def decide(
+        self, hits: List[Tuple[int, float, Dict, Dict]], domains: Optional[list], num_results: int
+    ) -> Tuple[str, List[Tuple[int, float, Dict, Dict]]]:
+        """
+        hits are search_memory_hybrid results. Returns (mode, qualifying hits).
+        """
+        now = int(time.time())
+        good = [h for h in hits if self.qualifies(h[2], h[3], domains, now)]
+
+        if len(good) >= min(self.min_hits, num_results):
+            mode = MODE_MEMORY
+        elif good:
+            mode = MODE_HYBRID
+        else:
+            mode = MODE_PROVIDERS
+        return mode, good
+
+    # ---------------- metrics ----------------
+
+    def record(self, mode: str, providers_skipped: int = 0):
+        with self._lock:
+            self.counters["lookups"] += 1
+            self.counters[mode] += 1
+            self.counters["provider_calls_avoided"] += providers_skipped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+        lookups = c["lookups"] or 1
+        c["memory_hit_rate"] = round(c[MODE_MEMORY] / lookups, 4)
+        c["memory_used_rate"] = round((c[MODE_MEMORY] + c[MODE_HYBRID]) / lookups, 4)
+        return c
@@ -1,87 +1,559 @@
-from typing import List, Optional
+import os
+import time
+import heapq
+import asyncio
+import threading
+from typing import List, Optional, Dict, Any, Tuple
 from models import SearchItem
-from ranking import dedupe_and_rank
-from cache import make_key, get_cache, set_cache
+from ranking import dedupe_and_rank, dedupe, default_pipeline
+from cache import make_key, get_cache, set_cache, aget_cache, atry_lock, aunlock
+from cache_policy import result_ttls, RESULT_DEGRADED_TTL, RESULT_STALE_TTL
 import load_env
 
 # Vector memory
-from vector_memory.vector_store import add_memory_item, search_memory
-from search import MemorySearchEngine
+from vector_memory.vector_store import search_memory_hybrid, record_hits
+from vector_memory.ingest import ingest_queue
+from embeddings import get_embedding_service
+from semantic_cache import semantic_cache, SEMANTIC_CACHE_ENABLED
+from singleflight import SingleFlight
+from memory_policy import MemoryPolicy, MODE_MEMORY, MODE_HYBRID, cosine_from_l2
 
 # Providers
 from providers.base import SearchProvider
+from providers.health import (
+    ProviderHealthRegistry, is_quota_error,
+    STATUS_OK, STATUS_TIMEOUT, STATUS_ERROR, STATUS_QUOTA, STATUS_CANCELLED,
+)
 from providers.exa_provider import ExaProvider
 from providers.serpapi_provider import SerpAPIProvider
 
 
+# Budgets for the async fan-out (seconds)
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", 8.0))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", 10.0))
+
+# Ask providers for more than num_results; the ranking prefilter keeps model
+# cost flat while recall goes up.
+PROVIDER_FETCH_MULTIPLIER = float(os.getenv("PROVIDER_FETCH_MULTIPLIER", 1.0))
+
+# Early termination: stop waiting for providers once num_results candidates
+# clear EARLY_STOP_MIN_SCORE on the cheap (keyword + provider) ranking score,
+# or the cheap top-k didn't change with the latest provider. Providers still
+# running finish in the background and their results go to memory.
+EARLY_TERMINATION = os.getenv("EARLY_TERMINATION", "0") == "1"
+EARLY_STOP_MIN_SCORE = float(os.getenv("EARLY_STOP_MIN_SCORE", 0.40))
+
+# Hedging: a provider still running past its observed p95 gets a duplicate
+# request; whichever copy answers first wins.
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0") == "1"
+
+
 class SearchOrchestrator:
-    def __init__(self, providers: List[SearchProvider]):
+    def __init__(
+        self,
+        providers: List[SearchProvider],
+        provider_timeout: float = PROVIDER_TIMEOUT,
+        deadline: float = SEARCH_DEADLINE,
+    ):
         self.providers = providers
-        self.embedder = MemorySearchEngine()   # reuse embedding model
+        self.provider_timeout = provider_timeout
+        self.deadline = deadline
+        self.memory_policy = MemoryPolicy()
+        self.flights = SingleFlight("orchestrator")
+        self.health = ProviderHealthRegistry()
+        for provider in providers:
+            self.health.get(provider.name)   # listed on /providers/health before first use
 
-    def search(self, query: str, domains: Optional[list], num_results: int) -> List[SearchItem]:
+        # Stale-while-revalidate bookkeeping
+        self._refreshing = set()
+        self._background = set()
+        self._stats_lock = threading.Lock()
+        self.result_cache_counters = {
+            "fresh_hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
 
-        # --------------- CACHE CHECK ---------------
-        cache_key = make_key("orchestrator", query, domains, num_results, False)
-        cached = get_cache(cache_key)
-        if cached:
-            return [SearchItem(**item) for item in cached["results"]]
-        # --------------------------------------------
+    @property
+    def embedder(self):
+        return get_embedding_service()   # shared process-wide model
 
-        # --------------- MEMORY VECTOR SEARCH ---------------
+    # ---------------- shared steps ----------------
+
+    def _cache_key(self, query: str, domains: Optional[list], num_results: int) -> str:
+        return make_key("orchestrator", query, domains, num_results, False)
+
+    def _semantic_scope(self, domains: Optional[list], num_results: int) -> str:
+        return make_key("orchestrator", domains, num_results)
+
+    @staticmethod
+    def _entry(cached: Optional[Dict[str, Any]]) -> Optional[Tuple[List[SearchItem], bool]]:
+        """(items, stale) for a cached result, or None. items may be [] (negative entry)."""
+        if cached is None:
+            return None
+        items = [SearchItem(**item) for item in cached["results"]]
+        return items, cached.get("fresh_until", float("inf")) < time.time()
+
+    @classmethod
+    def _items(cls, cached: Optional[Dict[str, Any]]) -> Optional[List[SearchItem]]:
+        entry = cls._entry(cached)
+        return entry[0] if entry else None
+
+    @classmethod
+    def _usable_neighbour(cls, cached: Optional[Dict[str, Any]]) -> Optional[Tuple[List[SearchItem], bool]]:
+        # Another query's entry is only served while fresh and non-empty
+        entry = cls._entry(cached)
+        return entry if entry and entry[0] and not entry[1] else None
+
+    async def _alookup_cache(
+        self, cache_key: str, query: str, domains: Optional[list], num_results: int
+    ) -> Optional[Tuple[List[SearchItem], bool]]:
+        """Exact then semantic cache lookup; only the embedding runs in a thread."""
+        entry = self._entry(await aget_cache(cache_key))
+
+        if entry is None and SEMANTIC_CACHE_ENABLED:
+            query_vec = await asyncio.to_thread(self.embedder.embed, query)
+            hit = semantic_cache.lookup(self._semantic_scope(domains, num_results), query_vec)
+            if hit:
+                entry = self._usable_neighbour(await aget_cache(hit[0]))
+
+        return entry
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.result_cache_counters[name] += 1
+
+    def _record_hit(self, items: List[SearchItem], stale: bool):
+        self._count("stale_hits" if stale else "negative_hits" if not items else "fresh_hits")
+
+    def _lookup_memory(self, query: str, domains: Optional[list], num_results: int) -> Tuple[str, List[SearchItem]]:
+        """
+        Returns (mode, memory items). mode is "memory" when the items can be
+        served as the answer, "hybrid" when they should be ranked together
+        with provider results, "providers" when memory has nothing usable.
+        """
         query_vec = self.embedder.embed(query)
-        memory_hits = search_memory(query_vec, top_k=5)
-
-        if memory_hits:
-            mem_items = []
-            for faiss_id, dist, meta in memory_hits:
-                mem_items.append(
-                    SearchItem(
-                        title=meta.get("title", ""),
-                        url=meta.get("url", ""),
-                        text=meta.get("text", ""),
-                        provider="memory",
-                        score=1 / (1 + dist)
-                    )
+        memory_hits = search_memory_hybrid(query, query_vec, top_k=max(5, num_results))
+        mode, good = self.memory_policy.decide(memory_hits, domains, num_results)
+        good = good[:num_results]
+
+        # Only items that are served (or ranked, in hybrid mode) count as used
+        record_hits([faiss_id for faiss_id, _, _, _ in good])
+
+        mem_items = []
+        for faiss_id, fused, meta, signals in good:
+            dist = signals.get("distance")
+            mem_items.append(
+                SearchItem(
+                    title=meta.get("title", ""),
+                    url=meta.get("url", ""),
+                    text=meta.get("text", ""),
+                    provider="memory",
+                    semantic_score=cosine_from_l2(dist) if dist is not None else None,
+                    final_score=fused
                 )
-            return mem_items[:num_results]
-        # ---------------------------------------------------
+            )
 
-        # --------------- MULTI-PROVIDER SEARCH ---------------
-        all_results: List[SearchItem] = []
+        self.memory_policy.record(mode, len(self.providers) if mode == MODE_MEMORY else 0)
+        return mode, mem_items
 
-        for provider in self.providers:
-            try:
-                results = provider.search(query, domains, num_results)
-                all_results.extend(results)
-            except Exception as e:
-                print(f"Provider {provider.name} failed: {e}")
-        # ----------------------------------------------------
+    def _fetch_count(self, num_results: int) -> int:
+        return max(num_results, int(round(num_results * PROVIDER_FETCH_MULTIPLIER)))
+
+    @staticmethod
+    def _memory_meta(item: SearchItem) -> Dict[str, Any]:
+        return {
+            "title": item.title,
+            "url": item.url,
+            "provider": item.provider,
+            "text": item.text,
+        }
+
+    def _remember(self, items: List[SearchItem]):
+        """Queue results that weren't ranked (late provider answers); the ingest worker embeds them."""
+        items = dedupe(items)
+        ingest_queue.submit([None] * len(items), [self._memory_meta(item) for item in items])
+
+    @staticmethod
+    def _outcome(provider_stats: Optional[Dict[str, Dict[str, Any]]]) -> Tuple[bool, bool]:
+        """(some provider answered, some provider failed / timed out / was skipped) for a fan-out."""
+        statuses = [s["status"] for s in (provider_stats or {}).values()]
+        answered = not statuses or STATUS_OK in statuses
+        degraded = any(status not in (STATUS_OK, "early_exit") for status in statuses)
+        return answered, degraded
+
+    def _rank_and_store(
+        self,
+        query: str,
+        cache_key: str,
+        all_results: List[SearchItem],
+        num_results: int,
+        ranking_stats: Optional[Dict[str, float]] = None,
+        domains: Optional[list] = None,
+        provider_stats: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> List[SearchItem]:
 
         # --------------- RANKING ---------------
-        final_results = dedupe_and_rank(query, all_results, num_results)
+        final_results, vectors = dedupe_and_rank(
+            query, all_results, num_results, with_vectors=True, stats=ranking_stats
+        )
         # ---------------------------------------
 
         # --------------- SAVE TO MEMORY ---------------
-        for item in final_results:
-            emb_text = item.text or item.title or ""
-            vec = self.embedder.embed(emb_text)
-            add_memory_item(vec, {
-                "title": item.title,
-                "url": item.url,
-                "provider": item.provider,
-                "text": item.text,
-            })
+        # Reuse the vectors computed during ranking. Persisting is write-behind:
+        # the ingest worker batches queued items into one WAL append.
+        ingest_queue.submit(vectors, [self._memory_meta(item) for item in final_results])
         # -----------------------------------------------
 
         # --------------- WRITE CACHE ---------------
+        # Fresh TTL depends on the query class; the entry then stays around
+        # stale for a while so expiry never puts a request on the slow path.
+        # "No results" is only remembered if a provider actually answered, and
+        # partial results from a degraded fan-out only briefly.
+        answered, degraded = self._outcome(provider_stats)
+        if not final_results and not answered:
+            return final_results
+
+        ttls = result_ttls(query, bool(final_results), degraded)
         set_cache(cache_key, {
-            "results": [r.dict() for r in final_results]
-        }, ttl_seconds=6 * 3600)
+            "results": [r.dict() for r in final_results],
+            "fresh_until": time.time() + ttls["fresh"],
+            "query_class": ttls["class"],
+        }, ttl_seconds=int(ttls["expire"]))
+
+        if SEMANTIC_CACHE_ENABLED and final_results:
+            semantic_cache.add(
+                self._semantic_scope(domains, num_results),
+                self.embedder.embed(query),
+                cache_key,
+                ttls["fresh"],
+            )
         # ------------------------------------------
 
         return final_results
 
+    def _routable(self) -> Tuple[List[SearchProvider], List[SearchProvider]]:
+        """(providers to call, providers skipped because their breaker is open)."""
+        routed, skipped = [], []
+        for provider in self.providers:
+            (routed if self.health.get(provider.name).breaker.allow() else skipped).append(provider)
+        return routed, skipped
+
+    @staticmethod
+    def _failure_status(e: BaseException) -> str:
+        return STATUS_QUOTA if is_quota_error(e) else STATUS_ERROR
+
+    # ---------------- stale-while-revalidate ----------------
+
+    def _claim_refresh(self, cache_key: str) -> bool:
+        with self._stats_lock:
+            if cache_key in self._refreshing:
+                return False
+            self._refreshing.add(cache_key)
+            return True
+
+    def _release_refresh(self, cache_key: str):
+        with self._stats_lock:
+            self._refreshing.discard(cache_key)
+
+    def _refresh_lock_key(self, cache_key: str) -> str:
+        return make_key("swr", cache_key)
+
+    def _store_refresh(self, query, cache_key, results, num_results, domains, provider_stats):
+        # A failed refresh keeps serving the stale entry rather than caching nothing
+        if results:
+            self._rank_and_store(
+                query, cache_key, results, num_results, domains=domains, provider_stats=provider_stats
+            )
+            self._count("refreshes")
+        else:
+            self._count("refresh_failures")
+            self._defer_refresh(cache_key)
+
+    def _defer_refresh(self, cache_key: str):
+        """
+        Mark the stale entry fresh for RESULT_DEGRADED_TTL, so hits keep
+        serving it without starting another refresh against the providers
+        on every request. It stays in Redis for another stale window.
+        """
+        cached = get_cache(cache_key)
+        if cached is None:
+            return
+        cached["fresh_until"] = time.time() + RESULT_DEGRADED_TTL
+        set_cache(cache_key, cached, ttl_seconds=int(RESULT_DEGRADED_TTL + RESULT_STALE_TTL))
+
+    async def _refresh_async(self, query: str, cache_key: str, domains: Optional[list], num_results: int):
+        lock_key = self._refresh_lock_key(cache_key)
+        token = await atry_lock(lock_key, self.deadline * 2)
+        try:
+            if token is None:
+                return
+            results, provider_stats = await self.fan_out(query, domains, num_results)
+            await asyncio.to_thread(
+                self._store_refresh, query, cache_key, results, num_results, domains, provider_stats
+            )
+        except Exception as e:
+            self._count("refresh_failures")
+            print(f"[orchestrator] refresh failed for {query!r}: {e!r}")
+            await asyncio.to_thread(self._defer_refresh, cache_key)
+        finally:
+            if token is not None:
+                await aunlock(lock_key, token)
+            self._release_refresh(cache_key)
+
+    def _schedule_refresh(self, query: str, cache_key: str, domains: Optional[list], num_results: int):
+        if not self._claim_refresh(cache_key):
+            return
+        task = asyncio.create_task(self._refresh_async(query, cache_key, domains, num_results))
+        self._background.add(task)   # keep a reference until it finishes
+        task.add_done_callback(self._background.discard)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            c = dict(self.result_cache_counters)
+            c["refreshing"] = len(self._refreshing)
+        return c
+
+    # ---------------- async fan-out path ----------------
+
+    async def _run_provider(
+        self, provider: SearchProvider, query: str, domains: Optional[list], num_results: int
+    ) -> Tuple[List[SearchItem], Dict[str, Any]]:
+        """
+        Run one provider's async search under its own (adaptive) timeout.
+        Raises only when cancelled: failures are reported in the returned
+        stats dict and recorded in the provider's health.
+        """
+        health = self.health.get(provider.name)
+        timeout = health.timeout(self.provider_timeout)
+        start = time.perf_counter()
+        stats: Dict[str, Any] = {"status": STATUS_OK, "results": 0, "timeout_s": round(timeout, 2)}
+        results: List[SearchItem] = []
+        error: Optional[BaseException] = None
+
+        try:
+            results = await asyncio.wait_for(
+                provider.search_async(query, domains, num_results),
+                timeout=timeout,
+            )
+            stats["results"] = len(results)
+        except asyncio.TimeoutError:
+            stats["status"] = STATUS_TIMEOUT
+        except asyncio.CancelledError as e:
+            # fan_out cancels with STATUS_TIMEOUT at the deadline and without a
+            # reason when a hedged copy won; either way the breaker hears back
+            status = STATUS_TIMEOUT if e.args and e.args[0] == STATUS_TIMEOUT else STATUS_CANCELLED
+            health.record(status, (time.perf_counter() - start) * 1000)
+            raise
+        except Exception as e:
+            error = e
+            stats["status"] = self._failure_status(e)
+            stats["error"] = repr(e)
+            print(f"Provider {provider.name} failed: {e}")
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        health.record(stats["status"], latency_ms, error)
+        stats["latency_ms"] = round(latency_ms, 1)
+        return results, stats
+
+    def _early_stop(
+        self, query: str, pool: List[SearchItem], num_results: int, previous_top: Optional[frozenset]
+    ) -> Tuple[bool, Optional[frozenset]]:
+        """(stop now?, current cheap top-k URLs) for the candidates received so far."""
+        items = dedupe(pool)
+        if len(items) < num_results:
+            return False, None
+
+        scores = default_pipeline.cheap_scores(query, items)
+        top = heapq.nlargest(num_results, range(len(items)), key=scores.__getitem__)
+        top_urls = frozenset(items[i].url for i in top)
+
+        strong = int((scores >= EARLY_STOP_MIN_SCORE).sum()) >= num_results
+        stable = previous_top is not None and top_urls == previous_top
+        return strong or stable, top_urls
+
+    def _collect_late(self, query: str, tasks: Dict["asyncio.Task", SearchProvider], deadline_at: float):
+        """After an early exit, let the remaining providers finish and store their results in memory."""
+
+        async def collect():
+            done, pending = await asyncio.wait(tasks.keys(), timeout=max(deadline_at - time.perf_counter(), 0.0))
+            late: List[SearchItem] = []
+            for task in pending:
+                task.cancel(STATUS_TIMEOUT)
+            for task in done:
+                if not task.cancelled():
+                    late.extend(task.result()[0])
+            if late:
+                await asyncio.to_thread(self._remember, late)
+
+        task = asyncio.create_task(collect())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def fan_out(
+        self, query: str, domains: Optional[list], num_results: int
+    ) -> Tuple[List[SearchItem], Dict[str, Dict[str, Any]]]:
+        """
+        Query all routable providers concurrently. Providers with an open
+        circuit breaker are skipped ("circuit_open"); providers still running
+        when the global deadline passes are dropped ("deadline").
+
+        With HEDGE_REQUESTS, a provider running past its p95 gets one
+        duplicate request. With EARLY_TERMINATION, the fan-out returns as soon
+        as the results received are good enough; providers still running are
+        reported as "early_exit" and finish in the background.
+        """
+        start = time.perf_counter()
+        deadline_at = start + self.deadline
+        fetch = self._fetch_count(num_results)
+        routed, skipped = self._routable()
+
+        all_results: List[SearchItem] = []
+        provider_stats: Dict[str, Dict[str, Any]] = {
+            p.name: {"status": "circuit_open", "results": 0, "latency_ms": 0.0} for p in skipped
+        }
+
+        # task -> provider; a hedged provider has two tasks
+        running: Dict[asyncio.Task, SearchProvider] = {}
+
+        def launch(provider: SearchProvider):
+            running[asyncio.create_task(self._run_provider(provider, query, domains, fetch))] = provider
+
+        for provider in routed:
+            launch(provider)
+
+        hedge_at: Dict[str, float] = {}
+        if HEDGE_REQUESTS:
+            for provider in routed:
+                p95 = self.health.get(provider.name).p95_seconds()
+                if p95 is not None:
+                    hedge_at[provider.name] = start + p95
+        hedged = set()
+        top_urls: Optional[frozenset] = None
+        early = False
+
+        while running:
+            now = time.perf_counter()
+            if now >= deadline_at:
+                break
+            wake = min(
+                [deadline_at] + [at for name, at in hedge_at.items() if name not in hedged and name not in provider_stats]
+            )
+            done, _ = await asyncio.wait(
+                running.keys(), timeout=max(wake - now, 0.0), return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                provider = running.pop(task)
+                results, stats = task.result()
+                siblings = [t for t, p in running.items() if p is provider]
+                if stats["status"] != STATUS_OK and siblings:
+                    continue   # the other copy may still succeed
+                for sibling in siblings:
+                    sibling.cancel()
+                    running.pop(sibling)
+                if provider.name in hedged:
+                    stats["hedged"] = True
+                provider_stats[provider.name] = stats
+                all_results.extend(results)
+
+            # Hedge providers that are slower than usual
+            now = time.perf_counter()
+            for provider in set(running.values()):
+                at = hedge_at.get(provider.name)
+                if at is not None and now >= at and provider.name not in hedged:
+                    hedged.add(provider.name)
+                    if self.health.get(provider.name).breaker.allow():
+                        launch(provider)
+
+            if EARLY_TERMINATION and done and running:
+                early, top_urls = self._early_stop(query, all_results, num_results, top_urls)
+                if early:
+                    break
+
+        if early:
+            elapsed = round((time.perf_counter() - start) * 1000, 1)
+            for provider in running.values():
+                provider_stats.setdefault(provider.name, {"status": "early_exit", "results": 0, "latency_ms": elapsed})
+            self._collect_late(query, dict(running), deadline_at)
+            return all_results, provider_stats
+
+        # Each cancelled task records the timeout in its provider's health
+        for task, provider in running.items():
+            task.cancel(STATUS_TIMEOUT)
+            if provider.name in provider_stats:
+                continue
+            provider_stats[provider.name] = {
+                "status": "deadline",
+                "results": 0,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            }
+
+        return all_results, provider_stats
+
+    async def search_async(
+        self, query: str, domains: Optional[list], num_results: int
+    ) -> Tuple[List[SearchItem], Dict[str, Any]]:
+        """
+        Cache, memory, then provider fan-out for one query. Returns (results, stats) where stats holds:
+          - "source": "cache", "memory", "hybrid" or "providers"
+          - "stale": served from an expired entry being refreshed (cache only)
+          - "providers": per-provider status / latency (provider path only)
+          - "ranking": per-stage ranking timings (provider path only)
+        """
+
+        # --------------- CACHE CHECK ---------------
+        cache_key = self._cache_key(query, domains, num_results)
+        entry = await self._alookup_cache(cache_key, query, domains, num_results)
+        if entry is not None:
+            items, stale = entry
+            self._record_hit(items, stale)
+            if stale:
+                # Serve now, refresh in the background
+                self._schedule_refresh(query, cache_key, domains, num_results)
+            return items, {"source": "cache", "stale": stale}
+        # --------------------------------------------
+
+        async def peek():
+            items = self._items(await aget_cache(cache_key))
+            return (items, {"source": "cache", "coalesced": True}) if items is not None else None
+
+        # Identical concurrent misses (here or in another worker) share one search
+        return await self.flights.do_async(
+            cache_key,
+            lambda: self._search_uncached_async(query, cache_key, domains, num_results),
+            peek=peek,
+        )
+
+    async def _search_uncached_async(
+        self, query: str, cache_key: str, domains: Optional[list], num_results: int
+    ) -> Tuple[List[SearchItem], Dict[str, Any]]:
+
+        # --------------- MEMORY VECTOR SEARCH ---------------
+        mode, mem_items = await asyncio.to_thread(self._lookup_memory, query, domains, num_results)
+        if mode == MODE_MEMORY:
+            return mem_items, {"source": "memory"}
+        # ---------------------------------------------------
+
+        # --------------- MULTI-PROVIDER SEARCH ---------------
+        provider_results, provider_stats = await self.fan_out(query, domains, num_results)
+        # In hybrid mode, close-enough memory items compete in ranking
+        all_results = mem_items + provider_results
+        # ----------------------------------------------------
+
+        ranking_stats: Dict[str, float] = {}
+        final_results = await asyncio.to_thread(
+            self._rank_and_store, query, cache_key, all_results, num_results, ranking_stats, domains,
+            provider_stats,
+        )
+        return final_results, {
+            "source": MODE_HYBRID if mem_items else "providers",
+            "providers": provider_stats,
+            "ranking": ranking_stats,
+        }
+
 
 # ---- Instantiate Providers & Orchestrator ----
 exa = ExaProvider()
@@ -1,4 +1,5 @@
 # backend/providers/base.py
+import asyncio
 from typing import List, Optional
 from abc import ABC, abstractmethod
 from models import SearchItem
@@ -9,3 +10,11 @@ class SearchProvider(ABC):
     @abstractmethod
     def search(self, query: str, domains: Optional[list], num_results: int) -> List[SearchItem]:
         ...
+
+    async def search_async(self, query: str, domains: Optional[list], num_results: int) -> List[SearchItem]:
+        """
+        Async contract used by the orchestrator's fan-out. The default runs the
+        blocking search() in a worker thread; providers on the shared HTTP
+        transport (providers.transport) override it with a native async call.
+        """
+        return await asyncio.to_thread(self.search, query, domains, num_results)
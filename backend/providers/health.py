@@ -0,0 +1,145 @@
+# backend/providers/health.py
+"""
+Rolling health per SearchProvider: latency percentiles, error / timeout
+rates and quota signals over the last PROVIDER_HEALTH_WINDOW calls, plus a
+circuit breaker per provider.
+
+The orchestrator uses it to route around bad upstreams:
+  - providers with an open breaker are skipped (one probe per cool-down);
+  - a quota / rate-limit error trips the breaker at once;
+  - each provider's timeout adapts to its own observed p95, so a provider
+    that is usually fast doesn't get to hold a request for the full budget.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from circuit_breaker import CircuitBreaker
+
+PROVIDER_HEALTH_WINDOW = int(os.getenv("PROVIDER_HEALTH_WINDOW", 200))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", 5))
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv("PROVIDER_BREAKER_COOLDOWN", 30))
+
+# Adaptive timeout = clamp(p95 * multiplier, min, configured timeout),
+# once at least PROVIDER_ADAPTIVE_MIN_SAMPLES successful calls were seen
+PROVIDER_ADAPTIVE_TIMEOUT = os.getenv("PROVIDER_ADAPTIVE_TIMEOUT", "1") == "1"
+PROVIDER_TIMEOUT_MULTIPLIER = float(os.getenv("PROVIDER_TIMEOUT_MULTIPLIER", 2.0))
+PROVIDER_MIN_TIMEOUT = float(os.getenv("PROVIDER_MIN_TIMEOUT", 1.5))
+PROVIDER_ADAPTIVE_MIN_SAMPLES = int(os.getenv("PROVIDER_ADAPTIVE_MIN_SAMPLES", 20))
+
+QUOTA_STATUSES = (402, 429)
+QUOTA_MARKERS = ("rate limit", "quota", "too many requests")
+
+STATUS_OK = "ok"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+STATUS_QUOTA = "quota"
+STATUS_CANCELLED = "cancelled"   # superseded (e.g. the other hedged copy won); not a failure
+
+
+def is_quota_error(e: BaseException) -> bool:
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status in QUOTA_STATUSES:
+        return True
+    text = str(e).lower()
+    return any(m in text for m in QUOTA_MARKERS)
+
+
+def percentile(sorted_values, p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+class ProviderHealth:
+    def __init__(self, name: str, window: int = PROVIDER_HEALTH_WINDOW):
+        self.name = name
+        self.breaker = CircuitBreaker(f"provider:{name}", PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_COOLDOWN)
+
+        # (timestamp, status, latency_ms)
+        self._samples: Deque[Tuple[float, str, float]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.quota_errors = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    def record(self, status: str, latency_ms: float, error: Optional[BaseException] = None):
+        with self._lock:
+            self.calls += 1
+            self._samples.append((time.time(), status, latency_ms))
+            if error is not None:
+                self.last_error = repr(error)
+                self.last_error_at = time.time()
+            if status == STATUS_QUOTA:
+                self.quota_errors += 1
+
+        if status == STATUS_OK:
+            self.breaker.record_success()
+        elif status == STATUS_QUOTA:
+            self.breaker.trip()
+        elif status == STATUS_CANCELLED:
+            self.breaker.release()
+        else:
+            self.breaker.record_failure()
+
+    def _ok_latencies(self):
+        with self._lock:
+            return sorted(ms for _, status, ms in self._samples if status == STATUS_OK)
+
+    def timeout(self, configured: float) -> float:
+        """Per-call timeout in seconds, adapted to this provider's observed p95."""
+        if not PROVIDER_ADAPTIVE_TIMEOUT:
+            return configured
+        latencies = self._ok_latencies()
+        if len(latencies) < PROVIDER_ADAPTIVE_MIN_SAMPLES:
+            return configured
+        adaptive = percentile(latencies, 95) / 1000.0 * PROVIDER_TIMEOUT_MULTIPLIER
+        return min(configured, max(PROVIDER_MIN_TIMEOUT, adaptive))
+
+    def p95_seconds(self) -> Optional[float]:
+        """Observed p95 in seconds, or None until PROVIDER_ADAPTIVE_MIN_SAMPLES successful calls."""
+        latencies = self._ok_latencies()
+        if len(latencies) < PROVIDER_ADAPTIVE_MIN_SAMPLES:
+            return None
+        return percentile(latencies, 95) / 1000.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+            s: Dict[str, Any] = {
+                "calls": self.calls,
+                "quota_errors": self.quota_errors,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+            }
+
+        n = len(samples) or 1
+        latencies = sorted(ms for _, status, ms in samples if status == STATUS_OK)
+        s["window"] = len(samples)
+        s["error_rate"] = round(sum(1 for _, st, _ in samples if st in (STATUS_ERROR, STATUS_QUOTA)) / n, 4)
+        s["timeout_rate"] = round(sum(1 for _, st, _ in samples if st == STATUS_TIMEOUT) / n, 4)
+        s["latency_ms"] = {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)}
+        s["breaker"] = self.breaker.stats()
+        return s
+
+
+class ProviderHealthRegistry:
+    def __init__(self):
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> ProviderHealth:
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = ProviderHealth(name)
+            return self._providers[name]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = dict(self._providers)
+        return {name: h.stats() for name, h in providers.items()}
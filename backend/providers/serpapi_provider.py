@@ -1,9 +1,12 @@
 import os
-import requests
+from typing import Any, Dict, List, Optional
 from providers.base import SearchProvider
+from providers.transport import transport
 from models import SearchItem
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")   # point at a stub server for tests
+SERPAPI_CONCURRENCY = int(os.getenv("SERPAPI_CONCURRENCY", 8))
 
 if not SERPAPI_KEY:
     raise RuntimeError("Missing SERPAPI_KEY for SerpAPIProvider")
@@ -11,26 +14,26 @@ if not SERPAPI_KEY:
 class SerpAPIProvider(SearchProvider):
     name = "serpapi"
 
-    def search(self, query, domains=None, num_results=10):
-
-        params = {
+    def _params(self, query: str, num_results: int) -> Dict[str, Any]:
+        return {
             "engine": "google",
             "q": query,
             "api_key": SERPAPI_KEY,
             "num": num_results
         }
 
-        response = requests.get("https://serpapi.com/search", params=params).json()
+    def _parse(self, response: Dict[str, Any], domains: Optional[list]) -> List[SearchItem]:
+        organic = response.get("organic_results", [])
 
         results = []
-        for item in response.get("organic_results", []):
+        for item in organic:
             results.append(
                 SearchItem(
                     title=item.get("title", ""),
                     url=item.get("link", ""),
                     text=item.get("snippet", ""),
                     provider=self.name,
-                    score=1.0
+                    provider_score=1.0
                 )
             )
 
@@ -47,3 +50,16 @@ class SerpAPIProvider(SearchProvider):
         # --------------------------------
 
         return results
+
+    def search(self, query, domains=None, num_results=10):
+        response = transport.get_json_blocking(SERPAPI_URL, params=self._params(query, num_results))
+        return self._parse(response, domains)
+
+    async def search_async(self, query, domains=None, num_results=10):
+        response = await transport.get_json(
+            SERPAPI_URL,
+            self.name,
+            concurrency=SERPAPI_CONCURRENCY,
+            params=self._params(query, num_results),
+        )
+        return self._parse(response, domains)
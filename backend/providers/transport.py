@@ -0,0 +1,161 @@
+# backend/providers/transport.py
+"""
+Shared HTTP transport for providers that call plain HTTP APIs.
+
+One pooled keep-alive httpx.AsyncClient per process (HTTP/2 when `h2` is
+installed), explicit connect/read timeouts, bounded retries with full-jitter
+exponential backoff on 429 / 5xx / connection errors, and a concurrency limit
+per provider. The blocking path gets a pooled requests.Session with the same
+timeouts and retry policy.
+
+Point a provider's base URL at a local stub server (or pass an
+httpx.MockTransport via client_kwargs) to test without the real upstream.
+"""
+
+import os
+import random
+import asyncio
+from typing import Any, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2.0))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 6.0))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.2))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 2.0))
+HTTP_PROVIDER_CONCURRENCY = int(os.getenv("HTTP_PROVIDER_CONCURRENCY", 16))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full jitter: uniform(0, min(max, base * 2^attempt)); honours a numeric Retry-After."""
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+class HTTPTransport:
+    def __init__(
+        self,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        retries: int = HTTP_RETRIES,
+        **client_kwargs: Any,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.client_kwargs = client_kwargs
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._session: Optional[requests.Session] = None
+
+    # ---------------- clients ----------------
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the server's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                ),
+                **self.client_kwargs,
+            )
+        return self._client
+
+    @property
+    def session(self) -> requests.Session:
+        """Pooled blocking session with the same retry policy, for sync callers."""
+        if self._session is None:
+            retry = Retry(
+                total=self.retries,
+                backoff_factor=HTTP_BACKOFF_BASE,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(["GET"]),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_maxsize=HTTP_MAX_KEEPALIVE, max_retries=retry)
+            self._session = requests.Session()
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+        return self._session
+
+    def _limit(self, provider: str, concurrency: int) -> asyncio.Semaphore:
+        if provider not in self._limits:
+            self._limits[provider] = asyncio.Semaphore(concurrency)
+        return self._limits[provider]
+
+    # ---------------- requests ----------------
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        provider: str,
+        concurrency: int = HTTP_PROVIDER_CONCURRENCY,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        Send a request with retries. Raises httpx.HTTPStatusError for a final
+        non-2xx response and httpx.TransportError when retries run out.
+        """
+        async with self._limit(provider, concurrency):
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if last:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+
+                if response.status_code in RETRY_STATUSES and not last:
+                    await asyncio.sleep(backoff_delay(attempt, response.headers.get("retry-after")))
+                    continue
+
+                response.raise_for_status()
+                return response
+
+    async def get_json(self, url: str, provider: str, **kwargs: Any) -> Any:
+        response = await self.request("GET", url, provider, **kwargs)
+        return response.json()
+
+    def get_json_blocking(self, url: str, **kwargs: Any) -> Any:
+        response = self.session.get(
+            url, timeout=(self.timeout.connect, self.timeout.read), **kwargs
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+# Shared by all HTTP providers in the process
+transport = HTTPTransport()
@@ -1,21 +1,48 @@
+import os
 import re
+import time
+import heapq
 import numpy as np
-from typing import List
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 from models import SearchItem
-from search import MemorySearchEngine
+from embeddings import get_embedding_service
 import load_env
 
-engine = MemorySearchEngine()      # for embeddings
-embed = engine.embed               # shortcut
 
+def parse_weights(raw: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """Parse "semantic=0.6,keyword=0.2" over defaults."""
+    weights = dict(defaults)
+    for part in filter(None, (p.strip() for p in raw.split(","))):
+        name, _, value = part.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
 
-# Provider scoring power
-PROVIDER_WEIGHTS = {
-    "exa": 1.30,
-    "brave": 1.00,
-    "serpapi": 0.90,   # added new provider
-    # any future provider will default to 0.8
-}
+
+# Provider scoring power, e.g. PROVIDER_WEIGHTS="exa=1.2,brave=1.1"
+PROVIDER_WEIGHTS = parse_weights(
+    os.getenv("PROVIDER_WEIGHTS", ""),
+    {
+        "exa": 1.30,
+        "brave": 1.00,
+        "serpapi": 0.90,
+        "memory": 1.00,    # previously ranked results, mixed in by the memory policy
+    },
+)
+DEFAULT_PROVIDER_WEIGHT = float(os.getenv("DEFAULT_PROVIDER_WEIGHT", 0.8))   # providers not listed
+
+# Final score = sum of weight * signal
+RANKING_WEIGHTS = parse_weights(
+    os.getenv("RANKING_WEIGHTS", ""),
+    {"semantic": 0.55, "keyword": 0.25, "provider": 0.20},
+)
+
+# Stage order for the default pipeline; "dedupe" and "prefilter" are optional
+RANKING_STAGES = [
+    s.strip() for s in os.getenv("RANKING_STAGES", "dedupe,prefilter,embed,score,select").split(",") if s.strip()
+]
+
+# Candidates that survive the cheap prefilter and get embedded (0 = all)
+PREFILTER_KEEP = int(os.getenv("RANKING_PREFILTER_KEEP", 40))
 
 
 def cosine_sim(a, b):
@@ -24,14 +51,46 @@ def cosine_sim(a, b):
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
 
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> set:
+    return set(TOKEN_RE.findall(text.lower()))
+
+
 def keyword_overlap(query: str, text: str) -> float:
-    q = set(re.findall(r"\w+", query.lower()))
-    t = set(re.findall(r"\w+", text.lower()))
+    q = tokenize(query)
+    t = tokenize(text)
     if not q:
         return 0.0
     return len(q & t) / len(q)
 
 
+# ---------------- Vectorized scoring ----------------
+
+def cosine_scores(q_vec: np.ndarray, t_vecs: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of q_vec against every row of t_vecs in one
+    matrix-vector product. Zero-norm rows score 0, like cosine_sim.
+    """
+    t_vecs = np.asarray(t_vecs, dtype="float32")
+    denom = np.linalg.norm(t_vecs, axis=1) * np.linalg.norm(q_vec)
+    dots = t_vecs @ np.asarray(q_vec, dtype="float32")
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+
+def keyword_scores(query: str, texts: List[str]) -> np.ndarray:
+    """keyword_overlap for many texts, tokenizing the query once."""
+    q = tokenize(query)
+    if not q:
+        return np.zeros(len(texts), dtype="float32")
+    return np.array([len(q & tokenize(t)) for t in texts], dtype="float32") / len(q)
+
+
+def provider_weights(items: List[SearchItem], weights: Dict[str, float] = PROVIDER_WEIGHTS) -> np.ndarray:
+    return np.array([weights.get(item.provider.lower(), DEFAULT_PROVIDER_WEIGHT) for item in items], dtype="float32")
+
+
 def dedupe(items: List[SearchItem]) -> List[SearchItem]:
     """
     Keep the BEST version of each URL after ranking.
@@ -51,43 +110,181 @@ def dedupe(items: List[SearchItem]) -> List[SearchItem]:
     return list(by_url.values())
 
 
-def dedupe_and_rank(query: str, items: List[SearchItem], limit: int) -> List[SearchItem]:
+# ---------------- Ranking pipeline ----------------
+
+class RankState:
+    """Candidates and their per-signal scores, handed from stage to stage."""
+
+    def __init__(self, query: str, items: List[SearchItem], limit: int):
+        self.query = query
+        self.items = items
+        self.limit = limit
+        self.texts: Optional[List[str]] = None
+        self.keyword: Optional[np.ndarray] = None
+        self.provider: Optional[np.ndarray] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.q_vec: Optional[np.ndarray] = None
+        self.final: Optional[np.ndarray] = None
+        self.stats: Dict[str, float] = {"candidates": len(items)}
 
-    # Step 1 — Deduplicate first pass
-    unique_items = dedupe(items)
+    def keep(self, indices: List[int]):
+        """Narrow the candidates, and every signal computed so far, to indices."""
+        self.items = [self.items[i] for i in indices]
+        if self.texts is not None:
+            self.texts = [self.texts[i] for i in indices]
+        for name in ("keyword", "provider", "vectors", "final"):
+            values = getattr(self, name)
+            if values is not None:
+                setattr(self, name, values[indices])
 
-    if not unique_items:
-        return []
 
-    # Step 2 — Embed the query once
-    q_vec = embed(query)
+# A stage is the name of a built-in one or a callable(pipeline, state)
+Stage = Union[str, Callable[["RankingPipeline", RankState], None]]
 
-    ranked = []
+REQUIRED_STAGES = ("embed", "score", "select")
 
-    for item in unique_items:
-        text = f"{item.title}\n{item.text}"
-        t_vec = embed(text)
 
-        semantic = cosine_sim(q_vec, t_vec)
-        keyword = keyword_overlap(query, text)
-        provider_weight = PROVIDER_WEIGHTS.get(item.provider.lower(), 0.8)
+class RankingPipeline:
+    """
+    Staged ranking, cheapest stages first by default:
+
+      1. dedupe     one pass by URL
+      2. prefilter  keyword + provider score only; keep the best prefilter_keep
+      3. embed      one batched encode for the query and the survivors
+      4. score      weighted semantic + keyword + provider
+      5. select     heap top-k
 
-        final_score = (
-            0.55 * semantic +
-            0.25 * keyword +
-            0.20 * provider_weight
+    Pass `stages` to reorder them, drop the optional ones (dedupe,
+    prefilter) or insert callables(pipeline, state) that rescore or filter
+    the RankState.
+
+    Per-stage wall time (ms) and candidate counts are reported so more
+    provider results can be fetched without paying model cost for all of them.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        provider_weights: Optional[Dict[str, float]] = None,
+        prefilter_keep: int = PREFILTER_KEEP,
+        stages: Optional[Sequence[Stage]] = None,
+    ):
+        self.weights = dict(weights or RANKING_WEIGHTS)
+        self.provider_weights = dict(provider_weights or PROVIDER_WEIGHTS)
+        self.prefilter_keep = prefilter_keep
+        self.stages = list(stages or RANKING_STAGES)
+
+        for stage in self.stages:
+            if isinstance(stage, str) and not hasattr(self, f"_stage_{stage}"):
+                raise ValueError(f"Unknown ranking stage {stage!r}")
+        positions = [self.stages.index(name) if name in self.stages else -1 for name in REQUIRED_STAGES]
+        if -1 in positions or positions != sorted(positions):
+            raise ValueError(f"Ranking stages must include {', '.join(REQUIRED_STAGES)} in that order")
+
+    def cheap_scores(self, query: str, items: List[SearchItem], texts: Optional[List[str]] = None) -> np.ndarray:
+        """Prefilter score (keyword + provider only, no model) for each item."""
+        texts = texts if texts is not None else [f"{item.title}\n{item.text}" for item in items]
+        w = self.weights
+        return (
+            w.get("keyword", 0.0) * keyword_scores(query, texts) +
+            w.get("provider", 0.0) * provider_weights(items, self.provider_weights)
         )
 
-        item.final_score = final_score
-        item.semantic_score = semantic
-        item.keyword_score = keyword
+    def rank(self, query: str, items: List[SearchItem], limit: int) -> Tuple[List[SearchItem], List[np.ndarray], Dict[str, float]]:
+        """Returns (ranked items, their embeddings, stage stats)."""
+        state = RankState(query, items, limit)
+        if not items:
+            return [], [], state.stats
+        clock = time.perf_counter()
+
+        for stage in self.stages:
+            if isinstance(stage, str):
+                name, run = stage, getattr(self, f"_stage_{stage}")
+                run(state)
+            else:
+                name = getattr(stage, "__name__", "custom")
+                stage(self, state)
+
+            now = time.perf_counter()
+            state.stats[f"{name}_ms"] = round((now - clock) * 1000, 3)
+            clock = now
+
+            if not state.items:
+                return [], [], state.stats
+
+        return state.items, list(state.vectors), state.stats
+
+    # ---------------- stages ----------------
+
+    def _signals(self, state: RankState):
+        """Keyword and provider signals; no model needed."""
+        if state.texts is None:
+            state.texts = [f"{item.title}\n{item.text}" for item in state.items]
+        if state.keyword is None:
+            state.keyword = keyword_scores(state.query, state.texts)
+        if state.provider is None:
+            state.provider = provider_weights(state.items, self.provider_weights)
 
-        ranked.append(item)
+    def _stage_dedupe(self, state: RankState):
+        state.items = dedupe(state.items)
+        state.texts = state.keyword = state.provider = None
+        state.stats["after_dedupe"] = len(state.items)
 
-    # Step 3 — Sort
-    ranked = sorted(ranked, key=lambda x: x.final_score, reverse=True)
+    def _stage_prefilter(self, state: RankState):
+        self._signals(state)
+        w = self.weights
+        if self.prefilter_keep and len(state.items) > self.prefilter_keep:
+            cheap = w.get("keyword", 0.0) * state.keyword + w.get("provider", 0.0) * state.provider
+            state.keep(sorted(heapq.nlargest(self.prefilter_keep, range(len(state.items)), key=cheap.__getitem__)))
+        state.stats["after_prefilter"] = len(state.items)
+
+    def _stage_embed(self, state: RankState):
+        # Query + survivors in one batch
+        self._signals(state)
+        vecs = get_embedding_service().embed_batch([state.query] + state.texts)
+        state.q_vec, state.vectors = vecs[0], vecs[1:]
+
+    def _stage_score(self, state: RankState):
+        self._signals(state)
+        w = self.weights
+        semantic = cosine_scores(state.q_vec, state.vectors)
+        state.final = (
+            w.get("semantic", 0.0) * semantic +
+            w.get("keyword", 0.0) * state.keyword +
+            w.get("provider", 0.0) * state.provider
+        )
+        for i, item in enumerate(state.items):
+            item.final_score = float(state.final[i])
+            item.semantic_score = float(semantic[i])
+            item.keyword_score = float(state.keyword[i])
+            item.source_weight = float(state.provider[i])
+
+    def _stage_select(self, state: RankState):
+        # nlargest is stable, like sorted(..., reverse=True)
+        state.keep(heapq.nlargest(state.limit, range(len(state.items)), key=state.final.__getitem__))
+
+
+default_pipeline = RankingPipeline()
+
+
+def dedupe_and_rank(
+    query: str,
+    items: List[SearchItem],
+    limit: int,
+    with_vectors: bool = False,
+    stats: Optional[Dict[str, float]] = None,
+) -> Union[List[SearchItem], Tuple[List[SearchItem], List[np.ndarray]]]:
+    """
+    Rank items against the query with the default pipeline. With
+    with_vectors=True, also returns the embedding of each returned item
+    (aligned by position) so callers can reuse them instead of re-encoding.
+    Pass a dict as stats to receive per-stage timings.
+    """
+    ranked, vectors, stage_stats = default_pipeline.rank(query, items, limit)
 
-    # Step 4 — Final dedupe (preserve highest scoring)
-    ranked = dedupe(ranked)
+    if stats is not None:
+        stats.update(stage_stats)
 
-    return ranked[:limit]
+    if with_vectors:
+        return ranked, vectors
+    return ranked
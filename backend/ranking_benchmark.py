@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: per-item scoring loop vs. the vectorized scoring stage in
+ranking.dedupe_and_rank. Uses random vectors, so no model is loaded.
+
+    cd backend
+    python ranking_benchmark.py --sizes 10 20 50 100 200
+"""
+
+import time
+import argparse
+import numpy as np
+
+from models import SearchItem
+from ranking import cosine_sim, keyword_overlap, cosine_scores, keyword_scores, provider_weights, PROVIDER_WEIGHTS
+
+WORDS = "world cup final winner argentina france messi goal penalty match season league team player".split()
+
+
+def make_candidates(n: int, dim: int, rng):
+    items = [
+        SearchItem(
+            title=" ".join(rng.choice(WORDS, 6)),
+            url=f"https://example.com/{i}",
+            text=" ".join(rng.choice(WORDS, 80)),
+            provider=["exa", "serpapi"][i % 2],
+        )
+        for i in range(n)
+    ]
+    texts = [f"{item.title}\n{item.text}" for item in items]
+    return items, texts, rng.normal(size=(n, dim)).astype("float32")
+
+
+def loop_scores(query, q_vec, items, texts, t_vecs):
+    """The original per-item scoring loop."""
+    out = []
+    for item, text, t_vec in zip(items, texts, t_vecs):
+        semantic = cosine_sim(q_vec, t_vec)
+        keyword = keyword_overlap(query, text)
+        weight = PROVIDER_WEIGHTS.get(item.provider.lower(), 0.8)
+        out.append(0.55 * semantic + 0.25 * keyword + 0.20 * weight)
+    return np.array(out)
+
+
+def vector_scores(query, q_vec, items, texts, t_vecs):
+    return (
+        0.55 * cosine_scores(q_vec, t_vecs) +
+        0.25 * keyword_scores(query, texts) +
+        0.20 * provider_weights(items)
+    )
+
+
+def best_of(fn, repeat, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 50, 100, 200, 500])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    query = "who won the world cup final 2022"
+    q_vec = rng.normal(size=args.dim).astype("float32")
+
+    print(f"{'n':>6}{'loop ms':>10}{'vector ms':>11}{'speedup':>9}{'max diff':>10}")
+    for n in args.sizes:
+        items, texts, t_vecs = make_candidates(n, args.dim, rng)
+        a = loop_scores(query, q_vec, items, texts, t_vecs)
+        b = vector_scores(query, q_vec, items, texts, t_vecs)
+
+        loop_ms = best_of(loop_scores, args.repeat, query, q_vec, items, texts, t_vecs)
+        vec_ms = best_of(vector_scores, args.repeat, query, q_vec, items, texts, t_vecs)
+        print(f"{n:>6}{loop_ms:>10.3f}{vec_ms:>11.3f}{loop_ms / vec_ms:>8.1f}x{np.abs(a - b).max():>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import os
 import json
-from typing import List, Dict, Any
+import time
+import asyncio
+from typing import AsyncIterator, List, Dict, Any, Tuple
 import load_env
 
 import google.generativeai as genai
@@ -50,6 +52,10 @@ Rules:
 
 MAX_AGENT_STEPS = 2  # medium-depth agent
 
+# Budget for all planner calls + subqueries of one request (seconds);
+# synthesis starts when it runs out.
+AGENT_DEADLINE = float(os.getenv("AGENT_DEADLINE", 12.0))
+
 
 # ---------------- HELPER: decide when to use agentic mode ----------------
 
@@ -176,22 +182,10 @@ Guidelines:
 
 # ---------------- FINAL SYNTHESIS CALL ----------------
 
-def call_synthesis(query: str, results: List[SearchItem]) -> Dict[str, Any]:
-  """
-  Compose final answer + citations from the pool of results.
-  Returns:
-  {
-    "summary": str,
-    "citations": [{ "index": int, "url": str }]
-  }
-  """
+SYNTHESIS_CONFIG = {"temperature": 0.2, "max_output_tokens": 400}
 
-  if not results:
-      return {
-          "summary": "No sources returned relevant information.",
-          "citations": []
-      }
 
+def build_synthesis_prompt(query: str, results: List[SearchItem]) -> str:
   context_text = build_results_context(results)
 
   user_prompt = f"""
@@ -206,98 +200,301 @@ Write a final answer that:
 - Then adds a short "What this means" section in bullet points.
 - Uses citations like [1], [2], ... matching the numbered sources.
 """
+  return SYNTHESIS_SYSTEM_PROMPT + "\n\n" + user_prompt
+
+
+def build_citations(results: List[SearchItem]) -> List[Dict[str, Any]]:
+  return [
+      {"index": i, "url": item.url}
+      for i, item in enumerate(results, 1)
+  ]
+
+
+def synthesis_error(e: Exception) -> str:
+  return f"AI synthesis failed. Showing raw results instead.\n\nError: {e!r}"
+
+
+def call_synthesis(query: str, results: List[SearchItem]) -> Dict[str, Any]:
+  """
+  Compose final answer + citations from the pool of results.
+  Returns:
+  {
+    "summary": str,
+    "citations": [{ "index": int, "url": str }]
+  }
+  """
+
+  if not results:
+      return {
+          "summary": "No sources returned relevant information.",
+          "citations": []
+      }
 
   model = genai.GenerativeModel("gemini-2.5-flash")
 
   try:
       resp = model.generate_content(
-          SYNTHESIS_SYSTEM_PROMPT + "\n\n" + user_prompt,
-          generation_config={"temperature": 0.2, "max_output_tokens": 400}
+          build_synthesis_prompt(query, results),
+          generation_config=SYNTHESIS_CONFIG
       )
       summary = resp.text.strip()
   except Exception as e:
-      summary = f"AI synthesis failed. Showing raw results instead.\n\nError: {e!r}"
-
-  # Build citations map
-  citations = [
-      {"index": i, "url": item.url}
-      for i, item in enumerate(results, 1)
-  ]
+      summary = synthesis_error(e)
 
   return {
       "summary": summary,
-      "citations": citations
+      "citations": build_citations(results)
   }
 
 
+async def stream_synthesis(query: str, results: List[SearchItem]) -> AsyncIterator[str]:
+  """
+  Same answer as call_synthesis, yielded chunk by chunk as Gemini produces it.
+  The blocking Gemini stream is consumed in a worker thread and handed over
+  through a queue.
+  """
+  if not results:
+      yield "No sources returned relevant information."
+      return
+
+  loop = asyncio.get_running_loop()
+  chunks: asyncio.Queue = asyncio.Queue()
+  end = object()
+
+  def produce():
+      try:
+          model = genai.GenerativeModel("gemini-2.5-flash")
+          resp = model.generate_content(
+              build_synthesis_prompt(query, results),
+              generation_config=SYNTHESIS_CONFIG,
+              stream=True
+          )
+          for chunk in resp:
+              if chunk.text:
+                  loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+      except Exception as e:
+          loop.call_soon_threadsafe(chunks.put_nowait, synthesis_error(e))
+      finally:
+          loop.call_soon_threadsafe(chunks.put_nowait, end)
+
+  producer = asyncio.ensure_future(asyncio.to_thread(produce))
+  try:
+      while True:
+          chunk = await chunks.get()
+          if chunk is end:
+              break
+          yield chunk
+  finally:
+      # A disconnected client stops reading; the thread finishes on its own
+      if producer.done():
+          producer.result()
+
+
+# ---------------- SUBQUERY FAN-OUT ----------------
+
+def _ms(since: float) -> float:
+  return round((time.perf_counter() - since) * 1000, 1)
+
+
+async def run_subqueries(subqueries: List[str], budget: float) -> Tuple[List[SearchItem], List[Dict[str, Any]]]:
+  """
+  Run one step's subqueries concurrently through the orchestrator.
+  Subqueries still running after `budget` seconds are dropped (their search
+  keeps going under single-flight and lands in the cache for next time).
+  Returns (results in subquery order, per-subquery stats).
+  """
+  start = time.perf_counter()
+  finished_ms: Dict[int, float] = {}
+
+  async def timed(i: int, sq: str):
+      try:
+          return await orchestrator.search_async(query=sq, domains=None, num_results=5)
+      finally:
+          finished_ms[i] = _ms(start)
+
+  tasks = [asyncio.create_task(timed(i, sq)) for i, sq in enumerate(subqueries)]
+  done, _ = await asyncio.wait(tasks, timeout=max(budget, 0.0))
+
+  results: List[SearchItem] = []
+  stats: List[Dict[str, Any]] = []
+  for i, (sq, task) in enumerate(zip(subqueries, tasks)):
+      entry: Dict[str, Any] = {"query": sq, "status": "ok", "results": 0, "latency_ms": finished_ms.get(i)}
+      if task not in done:
+          task.cancel()
+          entry["status"] = "deadline"
+          entry["latency_ms"] = _ms(start)
+      elif task.exception() is not None:
+          entry["status"] = "error"
+          entry["error"] = repr(task.exception())
+          print(f"[agent] extra search failed for {sq!r}: {task.exception()}")
+      else:
+          extra, search_stats = task.result()
+          results.extend(extra)
+          entry["results"] = len(extra)
+          entry["source"] = search_stats.get("source")
+      stats.append(entry)
+
+  return results, stats
+
+
+# ---------------- AGENT LOOP ----------------
+
+async def agent_steps(
+  query: str, all_results: List[SearchItem], trace: Dict[str, Any]
+) -> AsyncIterator[Dict[str, Any]]:
+  """
+  Run up to MAX_AGENT_STEPS planner + subquery rounds within AGENT_DEADLINE
+  (measured from trace["started"]). New results are merged into all_results
+  in place; each step's trace is yielded as soon as the step ends.
+  """
+  deadline = trace["started"] + AGENT_DEADLINE
+
+  for step in range(MAX_AGENT_STEPS):
+      step_start = time.perf_counter()
+      step_trace: Dict[str, Any] = {"step": step + 1}
+      trace["steps"].append(step_trace)
+
+      try:
+          plan = await asyncio.wait_for(
+              asyncio.to_thread(call_planner, query, all_results),
+              timeout=max(deadline - step_start, 0.0)
+          )
+      except asyncio.TimeoutError:
+          step_trace["planner_ms"] = _ms(step_start)
+          trace["stop_reason"] = "deadline"
+          yield step_trace
+          return
+      step_trace["planner_ms"] = _ms(step_start)
+
+      need_more = plan.get("need_more_search", False)
+      subqueries = plan.get("subqueries", [])
+      confidence = float(plan.get("confidence", 0.0))
+      step_trace["confidence"] = confidence
+
+      # If plan says no more search, or we are confident enough -> stop
+      if not need_more or confidence >= 0.8:
+          trace["stop_reason"] = "confident"
+          yield step_trace
+          return
+
+      # If no subqueries given, nothing else to do
+      if not subqueries:
+          trace["stop_reason"] = "no_subqueries"
+          yield step_trace
+          return
+
+      # Execute subqueries concurrently via orchestrator
+      search_start = time.perf_counter()
+      if deadline - search_start <= 0:
+          # The planner used up the budget: don't start searches that can't finish
+          trace["stop_reason"] = "deadline"
+          step_trace["total_ms"] = _ms(step_start)
+          yield step_trace
+          return
+      new_results, step_trace["subqueries"] = await run_subqueries(
+          subqueries, deadline - search_start
+      )
+      step_trace["search_ms"] = _ms(search_start)
+      step_trace["total_ms"] = _ms(step_start)
+
+      # Merge new results with existing ones, dedupe by URL
+      seen_urls = set(r.url for r in all_results)
+      for r in new_results:
+          if r.url not in seen_urls:
+              all_results.append(r)
+              seen_urls.add(r.url)
+
+      yield step_trace
+
+      if not new_results:
+          trace["stop_reason"] = "no_new_results"
+          return
+      if time.perf_counter() >= deadline:
+          trace["stop_reason"] = "deadline"
+          return
+
+  trace["stop_reason"] = "max_steps"
+
+
+def _new_trace() -> Dict[str, Any]:
+  return {"agentic": False, "steps": [], "stop_reason": None, "started": time.perf_counter()}
+
+
+def _finish_trace(trace: Dict[str, Any], synthesis_start: float) -> Dict[str, Any]:
+  trace["synthesis_ms"] = _ms(synthesis_start)
+  trace["total_ms"] = _ms(trace.pop("started"))
+  return trace
+
+
 # ---------------- PUBLIC ENTRYPOINT ----------------
 
-def run_reasoning_layer(query: str, initial_results: List[SearchItem]) -> Dict[str, Any]:
+async def run_reasoning_layer(query: str, initial_results: List[SearchItem]) -> Dict[str, Any]:
   """
   Main reasoning entrypoint.
 
   - Automatically decides whether to run multi-step agentic search
     (up to MAX_AGENT_STEPS) based on query + initial results.
+  - Planner calls and subqueries share one AGENT_DEADLINE budget; a step's
+    subqueries run concurrently, and synthesis starts once the budget is spent.
   - Always returns:
       {
         "summary": str,
-        "citations": [{ "index": int, "url": str }]
+        "citations": [{ "index": int, "url": str }],
+        "trace": {"agentic", "steps", "stop_reason", "synthesis_ms", "total_ms"}
       }
   """
+  trace = _new_trace()
 
   # If no results at all, just synthesize a fallback
   if not initial_results:
       return {
           "summary": "No results were found for this query.",
-          "citations": []
+          "citations": [],
+          "trace": _finish_trace(trace, time.perf_counter())
       }
 
-  use_agent = should_use_agentic(query, initial_results)
+  all_results: List[SearchItem] = list(initial_results)
+  trace["agentic"] = should_use_agentic(query, initial_results)
 
-  # If we decide it's simple enough, just do one-shot synthesis.
-  if not use_agent:
-      return call_synthesis(query, initial_results)
+  # Agentic mode: enrich all_results before synthesis
+  if trace["agentic"]:
+      async for _ in agent_steps(query, all_results, trace):
+          pass
 
-  # Agentic mode: up to 2 steps
-  all_results: List[SearchItem] = list(initial_results)
+  # Final synthesis over the enriched result set
+  synthesis_start = time.perf_counter()
+  answer = await asyncio.to_thread(call_synthesis, query, all_results)
+  answer["trace"] = _finish_trace(trace, synthesis_start)
+  return answer
 
-  for step in range(MAX_AGENT_STEPS):
-      plan = call_planner(query, all_results)
 
-      need_more = plan.get("need_more_search", False)
-      subqueries = plan.get("subqueries", [])
-      confidence = float(plan.get("confidence", 0.0))
+async def stream_reasoning_layer(query: str, initial_results: List[SearchItem]) -> AsyncIterator[Dict[str, Any]]:
+  """
+  Streaming variant of run_reasoning_layer. Yields events:
+      {"event": "agent_step", "step": {...}}      after each agent step
+      {"event": "token", "text": str}             answer chunks as generated
+      {"event": "done", "citations": [...], "reasoning_stats": {...}}
+  """
+  trace = _new_trace()
 
-      # If plan says no more search, or we are confident enough -> stop
-      if not need_more or confidence >= 0.8:
-          break
+  if not initial_results:
+      yield {"event": "token", "text": "No results were found for this query."}
+      yield {"event": "done", "citations": [], "reasoning_stats": _finish_trace(trace, time.perf_counter())}
+      return
 
-      # If no subqueries given, nothing else to do
-      if not subqueries:
-          break
-
-      # Execute subqueries via orchestrator
-      new_results: List[SearchItem] = []
-      for sq in subqueries:
-          try:
-              extra = orchestrator.search(
-                  query=sq,
-                  domains=None,
-                  num_results=5
-              )
-              new_results.extend(extra)
-          except Exception as e:
-              print(f"[agent] extra search failed for {sq!r}: {e}")
+  all_results: List[SearchItem] = list(initial_results)
+  trace["agentic"] = should_use_agentic(query, initial_results)
 
-      if not new_results:
-          break
+  if trace["agentic"]:
+      async for step_trace in agent_steps(query, all_results, trace):
+          yield {"event": "agent_step", "step": step_trace}
 
-      # Merge new results with existing ones, dedupe by URL
-      seen_urls = set(r.url for r in all_results)
-      for r in new_results:
-          if r.url not in seen_urls:
-              all_results.append(r)
-              seen_urls.add(r.url)
+  synthesis_start = time.perf_counter()
+  async for text in stream_synthesis(query, all_results):
+      yield {"event": "token", "text": text}
 
-  # Final synthesis over the enriched result set
-  return call_synthesis(query, all_results)
+  yield {
+      "event": "done",
+      "citations": build_citations(all_results) if all_results else [],
+      "reasoning_stats": _finish_trace(trace, synthesis_start),
+  }
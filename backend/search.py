@@ -11,9 +11,10 @@ env_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 from exa_py import Exa
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+from embeddings import get_embedding_service
+
 
 class MemorySearchEngine:
     def __init__(self):
@@ -22,14 +23,30 @@ class MemorySearchEngine:
         if not self.api_key:
             raise ValueError("Missing EXA_API_KEY in environment!")
 
-        # Initialize EXA client
-        self.exa = Exa(self.api_key)
+        self._exa = None
+
+    @property
+    def exa(self):
+        # EXA client is only needed by search(); create it on first use
+        if self._exa is None:
+            self._exa = Exa(self.api_key)
+        return self._exa
 
-        # Load embedding model
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    @property
+    def embedder(self):
+        # Shared, lazily loaded embedding model (see embeddings.py)
+        return get_embedding_service()
+
+    @property
+    def model(self):
+        return self.embedder.model
 
     def embed(self, text: str):
-        return self.model.encode([text], convert_to_numpy=True)[0]
+        return self.embedder.embed(text)
+
+    def embed_batch(self, texts: List[str]):
+        """Encode many texts in one forward pass; returns a (n, dim) matrix."""
+        return self.embedder.embed_batch(texts)
 
     def cosine_sim(self, a, b):
         if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
@@ -100,20 +117,22 @@ class MemorySearchEngine:
         # Embed query once
         query_vec = self.embed(query)
 
+        # Strict post-filtering: DO NOT include if not in domain list
+        hits = [
+            r for r in exa_results.results
+            if not normalized_domains or self.domain_allowed(r.url, normalized_domains)
+        ]
+
+        # Embed all candidates in one batch
+        text_vecs = self.embed_batch([f"{r.title or ''}\n{r.text or ''}" for r in hits])
+
         final_results = []
 
-        for r in exa_results.results:
+        for r, text_vec in zip(hits, text_vecs):
             text = r.text or ""
             title = r.title or ""
             combined_text = f"{title}\n{text}"
 
-            # Strict post-filtering: DO NOT include if not in domain list
-            if normalized_domains:
-                if not self.domain_allowed(r.url, normalized_domains):
-                    continue
-
-            text_vec = self.embed(combined_text)
-
             semantic_score = self.cosine_sim(query_vec, text_vec)
             keyword_score = self.keyword_overlap(query, combined_text)
 
@@ -0,0 +1,138 @@
+# backend/semantic_cache.py
+"""
+Semantic query cache: maps query embeddings to the Redis key of an already
+cached result, so near-duplicate phrasings ("who won the world cup 2022" /
+"world cup 2022 winner") reuse one provider + Gemini round trip.
+
+Entries are partitioned by scope (namespace, domain filter, num_results), so
+a hit always has the same filters as the query. The per-scope index is a
+normalized float32 matrix searched with one matrix-vector product, which is
+exact and sub-millisecond at the sizes kept here. Values stay in Redis; only
+keys and vectors live in-process.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+SEMANTIC_CACHE_MIN_COSINE = float(os.getenv("SEMANTIC_CACHE_MIN_COSINE", 0.90))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1") == "1"
+
+
+class _Scope:
+    """Vectors of one scope, kept in a growable matrix."""
+
+    def __init__(self, dim: int):
+        self.matrix = np.zeros((16, dim), dtype="float32")
+        self.ids = []
+
+    def add(self, entry_id: int, vec: np.ndarray):
+        if len(self.ids) == len(self.matrix):
+            self.matrix = np.vstack([self.matrix, np.zeros_like(self.matrix)])
+        self.matrix[len(self.ids)] = vec
+        self.ids.append(entry_id)
+
+    def remove(self, entry_id: int):
+        pos = self.ids.index(entry_id)
+        last = len(self.ids) - 1
+        self.matrix[pos] = self.matrix[last]
+        self.ids[pos] = self.ids[last]
+        self.ids.pop()
+
+    def best(self, vec: np.ndarray) -> Tuple[Optional[int], float]:
+        if not self.ids:
+            return None, -1.0
+        sims = self.matrix[:len(self.ids)] @ vec
+        pos = int(np.argmax(sims))
+        return self.ids[pos], float(sims[pos])
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        min_cosine: float = SEMANTIC_CACHE_MIN_COSINE,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        self.min_cosine = min_cosine
+        self.max_entries = max_entries
+
+        # entry_id -> (scope, cache_key, expires_at), in LRU order
+        self._entries: "OrderedDict[int, Tuple[str, str, float]]" = OrderedDict()
+        self._scopes: Dict[str, _Scope] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def _normalize(vec: np.ndarray) -> np.ndarray:
+        vec = np.asarray(vec, dtype="float32")
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _drop(self, entry_id: int):
+        scope, _, _ = self._entries.pop(entry_id)
+        self._scopes[scope].remove(entry_id)
+        if not self._scopes[scope].ids:
+            del self._scopes[scope]
+
+    def lookup(self, scope: str, vec: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Returns (cache_key, similarity) of the closest live entry in scope, if close enough."""
+        vec = self._normalize(vec)
+        now = time.time()
+
+        with self._lock:
+            while scope in self._scopes:
+                entry_id, sim = self._scopes[scope].best(vec)
+                if entry_id is None or sim < self.min_cosine:
+                    break
+                _, key, expires_at = self._entries[entry_id]
+                if expires_at < now:
+                    self._drop(entry_id)
+                    self.expired += 1
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return key, sim
+
+            self.misses += 1
+            return None
+
+    def add(self, scope: str, vec: np.ndarray, cache_key: str, ttl_seconds: float):
+        vec = self._normalize(vec)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            if scope not in self._scopes:
+                self._scopes[scope] = _Scope(len(vec))
+            self._scopes[scope].add(entry_id, vec)
+            self._entries[entry_id] = (scope, cache_key, time.time() + ttl_seconds)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "scopes": len(self._scopes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+# Shared by the orchestrator and LLM normalization
+semantic_cache = SemanticCache()
@@ -0,0 +1,175 @@
+# backend/singleflight.py
+"""
+Request coalescing ("single-flight") for cache misses.
+
+Concurrent callers with the same key share one computation:
+  - in-process, followers wait on the leader's future (threads) or task (asyncio);
+  - across workers, the leader holds a short-lived Redis lock "sf:<key>" and the
+    other workers poll `peek` (normally the exact cache lookup) until the result
+    is published or the lock goes away.
+
+Everything fails open: if Redis is unavailable, the wait times out or the
+lock holder finishes without publishing, the caller just does the work itself.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cache import make_key, try_lock, unlock, is_locked, atry_lock, aunlock, ais_locked
+
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", 20))
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", 15))
+SINGLEFLIGHT_POLL_MS = float(os.getenv("SINGLEFLIGHT_POLL_MS", 100))
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        name: str,
+        lock_ttl: float = SINGLEFLIGHT_LOCK_TTL,
+        wait: float = SINGLEFLIGHT_WAIT,
+        poll_ms: float = SINGLEFLIGHT_POLL_MS,
+    ):
+        self.name = name
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        self.poll = poll_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+
+        self.counters = {
+            "leaders": 0,
+            "coalesced": 0,         # waited on an in-process leader
+            "remote_waits": 0,      # another worker held the lock
+            "remote_hits": 0,       # ...and published the result in time
+            "fallbacks": 0,         # gave up waiting and computed anyway
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    # ---------------- threads ----------------
+
+    def do(self, key: str, fn: Callable[[], Any], peek: Optional[Callable[[], Any]] = None) -> Any:
+        """Returns fn() for key, computed once across concurrent callers."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not leader:
+            self._count("coalesced")
+            try:
+                return fut.result(timeout=self.wait)
+            except FutureTimeout:
+                self._count("fallbacks")
+                return fn()
+
+        self._count("leaders")
+        try:
+            result = self._lead(key, fn, peek)
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lead(self, key: str, fn: Callable[[], Any], peek: Optional[Callable[[], Any]]) -> Any:
+        if peek is None:
+            return fn()
+
+        lock_key = make_key("sf", key)
+        token = try_lock(lock_key, self.lock_ttl)
+        if token is not None:
+            try:
+                return fn()
+            finally:
+                unlock(lock_key, token)
+
+        # Another worker is computing it: wait for its result to be published
+        self._count("remote_waits")
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll)
+            value = peek()
+            if value is not None:
+                self._count("remote_hits")
+                return value
+            if not is_locked(lock_key):
+                break
+
+        self._count("fallbacks")
+        return fn()
+
+    # ---------------- asyncio ----------------
+
+    async def do_async(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        peek: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """
+        Async variant of do(). The shared work runs in its own task, so a
+        cancelled caller (e.g. a client disconnect) doesn't cancel it for the
+        others.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self._count("leaders")
+            task = asyncio.ensure_future(self._alead(key, fn, peek))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+        else:
+            self._count("coalesced")
+
+        return await asyncio.shield(task)
+
+    async def _alead(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        peek: Optional[Callable[[], Awaitable[Any]]],
+    ) -> Any:
+        if peek is None:
+            return await fn()
+
+        lock_key = make_key("sf", key)
+        token = await atry_lock(lock_key, self.lock_ttl)
+        if token is not None:
+            try:
+                return await fn()
+            finally:
+                await aunlock(lock_key, token)
+
+        self._count("remote_waits")
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll)
+            value = await peek()
+            if value is not None:
+                self._count("remote_hits")
+                return value
+            if not await ais_locked(lock_key):
+                break
+
+        self._count("fallbacks")
+        return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+        c["in_flight"] = len(self._inflight) + len(self._tasks)
+        return c
@@ -0,0 +1,34 @@
+# backend/tests/conftest.py
+
+import sys
+from pathlib import Path
+
+import faiss
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def memory_store(tmp_path, monkeypatch):
+    """vector_store pointed at an empty store under tmp_path."""
+    from vector_memory import vector_store
+    from vector_memory.locks import FileLock
+
+    monkeypatch.setattr(vector_store, "INDEX_PATH", tmp_path / "faiss_index.bin")
+    monkeypatch.setattr(vector_store, "MEMORY_PATH", tmp_path / "memory.json")
+    monkeypatch.setattr(vector_store, "DB_PATH", tmp_path / "memory.db")
+    monkeypatch.setattr(vector_store, "WAL_PATH", tmp_path / "memory.wal")
+    monkeypatch.setattr(vector_store, "LEXICAL_PATH", tmp_path / "lexical_index")
+    monkeypatch.setattr(vector_store, "_file_lock", FileLock(tmp_path / "memory.lock"))
+
+    monkeypatch.setattr(vector_store, "index", faiss.IndexIDMap2(faiss.IndexFlatL2(vector_store.EMBED_DIM)))
+    monkeypatch.setattr(vector_store, "_stores", None)
+    monkeypatch.setattr(vector_store, "_index_state", (-1, -1, -1))
+    monkeypatch.setattr(vector_store, "_wal_state", (0, 0, 0))
+    monkeypatch.setattr(vector_store, "_wal_offset", 0)
+    monkeypatch.setattr(vector_store, "wal_records", 0)
+    monkeypatch.setattr(vector_store, "_migrate_at", 0)
+    return vector_store
@@ -0,0 +1,103 @@
+# backend/tests/test_transport.py
+
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pytest
+
+from providers import transport as transport_module
+from providers.transport import HTTPTransport
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(transport_module, "backoff_delay", lambda attempt, retry_after=None: 0.0)
+
+
+def _mock(responses):
+    """HTTPTransport whose requests are answered from responses, in order."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        answer = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return httpx.Response(answer, json={"ok": answer == 200})
+
+    return HTTPTransport(retries=2, transport=httpx.MockTransport(handler)), calls
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_retries_5xx_then_succeeds():
+    transport, calls = _mock([503, 502, 200])
+    assert _run(transport.get_json("http://stub/search", "stub")) == {"ok": True}
+    assert len(calls) == 3
+
+
+def test_gives_up_after_retries():
+    transport, calls = _mock([503])
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(transport.get_json("http://stub/search", "stub"))
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    transport, calls = _mock([404, 200])
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(transport.get_json("http://stub/search", "stub"))
+    assert len(calls) == 1
+
+
+def test_retries_connection_errors():
+    transport, calls = _mock([httpx.ConnectError("refused"), 200])
+    assert _run(transport.get_json("http://stub/search", "stub")) == {"ok": True}
+    assert len(calls) == 2
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    delay = 1.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server():
+    server = HTTPServer(("127.0.0.1", 0), _SlowHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/search"
+    server.shutdown()
+    server.server_close()
+
+
+def test_read_timeout_against_stub_server(slow_server):
+    transport = HTTPTransport(connect_timeout=0.5, read_timeout=0.2, retries=1)
+
+    async def call():
+        try:
+            return await transport.get_json(slow_server, "stub")
+        finally:
+            await transport.aclose()
+
+    start = time.perf_counter()
+    with pytest.raises(httpx.ReadTimeout):
+        _run(call())
+    # Two attempts (one retry), each cut off at the read timeout
+    assert time.perf_counter() - start < 0.9
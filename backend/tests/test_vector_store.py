@@ -0,0 +1,69 @@
+# backend/tests/test_vector_store.py
+
+import numpy as np
+
+
+def _items(n, seed=0):
+    vectors = np.random.default_rng(seed).random((n, 384)).astype("float32")
+    metas = [{"url": f"https://e.com/{i}", "title": f"page {i}", "text": f"text {i}"} for i in range(n)]
+    return vectors, metas
+
+
+def _top_id(store, vector):
+    hits = store.search_memory(vector, top_k=1, record_hits=False)
+    return hits[0][0], hits[0][2]["url"]
+
+
+def test_upsert_into_ivf_keeps_ids_aligned(memory_store, monkeypatch):
+    monkeypatch.setattr(memory_store, "INDEX_TYPE", "ivf")
+    monkeypatch.setattr(memory_store, "ANN_THRESHOLD", 50)
+
+    vectors, metas = _items(100)
+    ids = memory_store.add_memory_items(list(vectors), metas)
+    assert memory_store.index_kind(memory_store.index) == "ivf"
+
+    # Changed text for an existing URL replaces its vector under the same id
+    changed = np.random.default_rng(1).random(384).astype("float32")
+    assert memory_store.add_memory_items(
+        [changed], [{"url": "https://e.com/10", "title": "page 10", "text": "new text"}]
+    ) == [ids[10]]
+
+    assert _top_id(memory_store, changed) == (ids[10], "https://e.com/10")
+    for i in (0, 50, 99):
+        assert _top_id(memory_store, vectors[i]) == (ids[i], f"https://e.com/{i}")
+
+
+def test_compaction_rebuilds_ivf(memory_store, monkeypatch):
+    monkeypatch.setattr(memory_store, "INDEX_TYPE", "ivf")
+    monkeypatch.setattr(memory_store, "ANN_THRESHOLD", 50)
+
+    vectors, metas = _items(100)
+    ids = memory_store.add_memory_items(list(vectors), metas)
+    monkeypatch.setattr(memory_store, "MAX_ITEMS", 80)
+
+    stats = memory_store.compact()
+    assert stats == {"evicted": 20, "rebuilt": True, "seconds": stats["seconds"]}
+    assert memory_store.index_kind(memory_store.index) == "ivf"
+
+    kept, _ = memory_store.all_vectors(memory_store.index)
+    assert sorted(kept.tolist()) == ids[20:]
+    assert _top_id(memory_store, vectors[50]) == (ids[50], "https://e.com/50")
+
+
+def test_canonical_url_only_drops_trackers(memory_store):
+    canonical_url = memory_store.canonical_url
+    assert canonical_url("https://blog.example.com/?s=faiss+hnsw") == "https://blog.example.com?s=faiss+hnsw"
+    assert canonical_url("https://e.com/a?q=a%20b&ref=home") == "https://e.com/a?q=a%20b&ref=home"
+    assert canonical_url("HTTPS://E.com/a/?utm_source=x&b=2&a=1&fbclid=y#top") == "https://e.com/a?a=1&b=2"
+
+
+def test_upsert_keeps_original_url(memory_store):
+    vectors, _ = _items(2)
+    first = memory_store.add_memory_items(
+        [vectors[0]], [{"url": "https://e.com/a?utm_source=x", "title": "a", "text": "one"}]
+    )
+    second = memory_store.add_memory_items(
+        [vectors[1]], [{"url": "https://e.com/a/?fbclid=y", "title": "a", "text": "two"}]
+    )
+    assert first == second
+    assert _top_id(memory_store, vectors[1]) == (first[0], "https://e.com/a/?fbclid=y")
@@ -0,0 +1,77 @@
+"""
+Recall / latency benchmark for the vector memory index backends.
+
+Builds every index type from vector_store over the same vectors and reports
+recall@k against the exact flat index, plus mean query latency.
+
+    cd backend
+    python -m vector_memory.benchmark --n 50000 --k 5
+    python -m vector_memory.benchmark --from-store --nprobe 32 --ef-search 128
+"""
+
+import time
+import argparse
+import faiss
+import numpy as np
+
+from vector_memory import vector_store
+from vector_memory.vector_store import EMBED_DIM, build_index, apply_search_params
+
+
+def synthetic_vectors(n: int, seed: int = 0) -> np.ndarray:
+    """Clustered, unit-normalized vectors (closer to real embeddings than pure noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 200), EMBED_DIM))
+    vecs = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, EMBED_DIM))
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs.astype("float32")
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50000, help="number of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--from-store", action="store_true", help="use the vectors in faiss_index.bin")
+    args = parser.parse_args()
+
+    if args.from_store:
+        # Read the live index (migration/compaction swap it); ids may have gaps
+        vector_store.load()
+        vectors = vector_store.all_vectors(vector_store.index)[1]
+    else:
+        vectors = synthetic_vectors(args.n)
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype("float32")
+
+    flat = build_index("flat", vectors)
+    _, truth = flat.search(queries, args.k)
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<8}{'recall@k':>10}{'ms/query':>10}{'build s':>10}")
+
+    for kind in ("flat", "hnsw", "ivf", "ivfpq"):
+        start = time.perf_counter()
+        idx = flat if kind == "flat" else build_index(kind, vectors)
+        build_s = time.perf_counter() - start
+        apply_search_params(idx, nprobe=args.nprobe, ef_search=args.ef_search)
+
+        start = time.perf_counter()
+        _, found = idx.search(queries, args.k)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        print(f"{kind:<8}{recall_at_k(truth, found):>10.3f}{ms:>10.3f}{build_s:>10.2f}")
+
+
+if __name__ == "__main__":
+    faiss.omp_set_num_threads(1)
+    main()
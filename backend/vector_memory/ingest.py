@@ -0,0 +1,201 @@
+# backend/vector_memory/ingest.py
+"""
+Write-behind ingestion for vector memory.
+
+Requests hand ranked results to IngestQueue.submit() and return; a single
+background thread drains the queue in batches (up to INGEST_BATCH_SIZE items
+or INGEST_FLUSH_MS after the first one) into one add_memory_items call each.
+Items submitted without a vector are embedded by the worker in one batch.
+
+The queue is bounded: when full, submit() waits up to INGEST_PUT_TIMEOUT_MS
+(backpressure) and then drops the rest of the batch, because memory is a
+best-effort cache of provider results and must never stall a request.
+drain() flushes what is queued on shutdown. Depth and ingestion lag (enqueue
+to persisted) are reported by stats().
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from vector_memory.vector_store import add_memory_items
+
+INGEST_ASYNC = os.getenv("INGEST_ASYNC", "1") == "1"         # 0 = write inline
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", 10000))  # items
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+INGEST_FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", 200))
+INGEST_PUT_TIMEOUT_MS = float(os.getenv("INGEST_PUT_TIMEOUT_MS", 50))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", 10))
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        capacity: int = INGEST_QUEUE_MAX,
+        batch_size: int = INGEST_BATCH_SIZE,
+        flush_ms: float = INGEST_FLUSH_MS,
+        put_timeout_ms: float = INGEST_PUT_TIMEOUT_MS,
+        enabled: bool = INGEST_ASYNC,
+    ):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush = flush_ms / 1000.0
+        self.put_timeout = put_timeout_ms / 1000.0
+        self.enabled = enabled
+
+        # (enqueued_at, vector or None, metadata)
+        self._q: "queue.Queue" = queue.Queue(maxsize=capacity)
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._busy = False
+
+        self.counters = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "last_batch_ms": 0.0,
+        }
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, value in deltas.items():
+                self.counters[name] += value
+
+    # ---------------- producer side ----------------
+
+    def submit(self, vectors: Sequence[Optional[np.ndarray]], metadatas: List[Dict[str, Any]]) -> int:
+        """
+        Queue items for persistence. vectors[i] may be None to have the
+        worker embed the item. Returns the number of items accepted.
+        """
+        if not metadatas:
+            return 0
+
+        if not self.enabled or self._closed:
+            self._write(list(vectors), metadatas, [time.time()] * len(metadatas))
+            return len(metadatas)
+
+        self._ensure_worker()
+        now = time.time()
+        accepted = 0
+        for vec, meta in zip(vectors, metadatas):
+            try:
+                self._q.put((now, vec, meta), timeout=self.put_timeout)
+            except queue.Full:
+                break
+            accepted += 1
+
+        self._count(submitted=accepted, dropped=len(metadatas) - accepted)
+        if accepted < len(metadatas):
+            print(f"[ingest] queue full, dropped {len(metadatas) - accepted} items")
+        return accepted
+
+    # ---------------- worker side ----------------
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="memory-ingest", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> list:
+        first = self._q.get()
+        batch = [first]
+        deadline = time.monotonic() + self.flush
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self._busy = True
+            try:
+                enqueued = [b[0] for b in batch]
+                self._write([b[1] for b in batch], [b[2] for b in batch], enqueued)
+            finally:
+                self._busy = False
+                for _ in batch:
+                    self._q.task_done()
+
+    def _write(self, vectors: List[Optional[np.ndarray]], metadatas: List[Dict[str, Any]], enqueued: List[float]):
+        start = time.perf_counter()
+        try:
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            if missing:
+                from embeddings import get_embedding_service
+                fresh = get_embedding_service().embed_batch(
+                    [f"{metadatas[i].get('title', '')}\n{metadatas[i].get('text', '')}" for i in missing]
+                )
+                for i, vec in zip(missing, fresh):
+                    vectors[i] = vec
+
+            add_memory_items(vectors, metadatas)
+        except Exception as e:
+            self._count(failed=len(metadatas))
+            print(f"[ingest] batch of {len(metadatas)} failed: {e!r}")
+            return
+
+        now = time.time()
+        lag_ms = (now - min(enqueued)) * 1000
+        with self._stats_lock:
+            self.counters["written"] += len(metadatas)
+            self.counters["batches"] += 1
+            self.counters["last_lag_ms"] = round(lag_ms, 1)
+            self.counters["max_lag_ms"] = round(max(self.counters["max_lag_ms"], lag_ms), 1)
+            self.counters["last_batch_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # ---------------- lifecycle ----------------
+
+    def drain(self, timeout: float = INGEST_DRAIN_TIMEOUT) -> bool:
+        """
+        Stop queueing (later submits write inline) and wait for queued items
+        to be persisted. Returns False if the timeout passed first.
+        """
+        self._closed = True
+        if self._worker is None:
+            return True
+
+        deadline = time.monotonic() + timeout
+        while self._q.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                print(f"[ingest] drain timed out with {self._q.qsize()} items queued")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._q.mutex:
+            oldest = self._q.queue[0][0] if self._q.queue else None
+        with self._stats_lock:
+            s = dict(self.counters)
+        s["depth"] = self._q.qsize()
+        s["capacity"] = self.capacity
+        s["busy"] = self._busy
+        s["oldest_pending_ms"] = round((time.time() - oldest) * 1000, 1) if oldest else 0.0
+        s["enabled"] = self.enabled
+        return s
+
+
+# Shared by the orchestrator; drained before vector_store's atexit checkpoint
+ingest_queue = IngestQueue()
+atexit.register(ingest_queue.drain)
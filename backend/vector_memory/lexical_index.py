@@ -0,0 +1,83 @@
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Tuple
+
+from whoosh import index as whoosh_index
+from whoosh.fields import Schema, ID, TEXT
+from whoosh.qparser import MultifieldParser, OrGroup
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.scoring import BM25F
+
+SCHEMA = Schema(
+    id=ID(stored=True, unique=True),
+    title=TEXT(analyzer=StemmingAnalyzer(), field_boost=1.5),
+    text=TEXT(analyzer=StemmingAnalyzer()),
+)
+
+
+class LexicalIndex:
+    """
+    Incremental BM25 inverted index over memory items, keyed by FAISS id.
+
+    Writes are expected to be serialized by the caller (vector_store holds its
+    writer lock); searches open a fresh searcher so they always see the last
+    commit, including ones made by other worker processes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        if whoosh_index.exists_in(str(self.path)):
+            self.ix = whoosh_index.open_dir(str(self.path))
+        else:
+            self.ix = whoosh_index.create_in(str(self.path), SCHEMA)
+
+        self.parser = MultifieldParser(["title", "text"], schema=self.ix.schema, group=OrGroup)
+
+    # ---------------- writes ----------------
+
+    def add_many(self, rows: Iterable[Tuple[int, Dict[str, Any]]]):
+        """Insert or replace documents in one commit."""
+        rows = list(rows)
+        if not rows:
+            return
+
+        writer = self.ix.writer()
+        try:
+            for faiss_id, meta in rows:
+                writer.update_document(
+                    id=str(faiss_id),
+                    title=meta.get("title", "") or "",
+                    text=meta.get("text", "") or "",
+                )
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit()
+
+    def delete(self, ids: Iterable[int]):
+        ids = list(ids)
+        if not ids:
+            return
+
+        writer = self.ix.writer()
+        for faiss_id in ids:
+            writer.delete_by_term("id", str(faiss_id))
+        writer.commit()
+
+    # ---------------- reads ----------------
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Returns [(faiss_id, bm25_score)] best first."""
+        try:
+            parsed = self.parser.parse(query)
+        except Exception:
+            return []
+
+        with self.ix.searcher(weighting=BM25F()) as searcher:
+            hits = searcher.search(parsed, limit=top_k)
+            return [(int(hit["id"]), float(hit.score)) for hit in hits]
+
+    def doc_count(self) -> int:
+        with self.ix.searcher() as searcher:
+            return searcher.doc_count()
@@ -0,0 +1,90 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:   # Windows dev machines: single process only
+    fcntl = None
+
+
+class RWLock:
+    """
+    Reader-writer lock for the in-process FAISS index. Many searches may run
+    at once; a writer waits for them to drain and blocks new readers while it
+    is waiting, so a steady stream of queries can't starve writes.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class FileLock:
+    """
+    Advisory flock() on a lock file, shared between worker processes.
+    Every acquisition opens its own descriptor, so threads in one process
+    also exclude each other correctly.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    @contextmanager
+    def _locked(self, mode, blocking: bool = True):
+        """Yields True once the lock is held, or False if non-blocking and busy."""
+        if fcntl is None:
+            yield True
+            return
+
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, mode if blocking else mode | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def exclusive(self):
+        return self._locked(fcntl.LOCK_EX if fcntl else None)
+
+    def shared(self, blocking: bool = True):
+        return self._locked(fcntl.LOCK_SH if fcntl else None, blocking)
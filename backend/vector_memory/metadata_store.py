@@ -0,0 +1,281 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Tuple
+
+# Columns that live on the per-URL documents row; everything else goes to items
+DOCUMENT_FIELDS = ("title", "text", "provider")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    url       TEXT PRIMARY KEY,
+    title     TEXT,
+    text      TEXT,
+    provider  TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id        INTEGER PRIMARY KEY,
+    url       TEXT NOT NULL,
+    timestamp INTEGER,
+    extra     TEXT,
+    hits      INTEGER NOT NULL DEFAULT 0,
+    last_hit  INTEGER,
+    url_key   TEXT
+);
+CREATE INDEX IF NOT EXISTS items_url ON items(url);
+"""
+
+# Columns added after the first schema version: (name, DDL)
+ITEM_COLUMNS = (
+    ("hits", "INTEGER NOT NULL DEFAULT 0"),
+    ("last_hit", "INTEGER"),
+    ("url_key", "TEXT"),
+)
+
+# ORDER BY clause per eviction policy (first rows are evicted first)
+EVICTION_ORDER = {
+    "lru": "COALESCE(i.last_hit, i.timestamp) ASC, i.id ASC",
+    "lfu": "i.hits ASC, COALESCE(i.last_hit, i.timestamp) ASC, i.id ASC",
+}
+
+
+class MetadataStore:
+    """
+    SQLite-backed metadata for vector memory, keyed by integer FAISS id.
+
+    Nothing is loaded at startup; lookups fetch only the rows a search hit
+    needs. Title/text/provider are stored once per URL in `documents`, so
+    repeated results for the same page don't duplicate their text.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+            have = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+            for name, ddl in ITEM_COLUMNS:
+                if name not in have:
+                    self._conn.execute(f"ALTER TABLE items ADD COLUMN {name} {ddl}")
+
+            if "url_key" not in have:
+                # Rows from before url_key stored their canonical URL as url
+                self._conn.execute("UPDATE items SET url_key = url")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS items_url_key ON items(url_key)")
+
+    # ---------------- writes ----------------
+
+    def put_many(self, rows: Iterable[Tuple[int, Dict[str, Any]]]):
+        """
+        Insert or replace (id, metadata) rows in one transaction. A replaced
+        item whose URL changed drops its old document if nothing else uses it.
+        """
+        docs, items = [], []
+        for faiss_id, meta in rows:
+            url = meta.get("url", "")
+            extra = {k: v for k, v in meta.items() if k not in DOCUMENT_FIELDS + ("url", "url_key", "timestamp")}
+            docs.append((url, meta.get("title", ""), meta.get("text", ""), meta.get("provider", "")))
+            items.append((
+                int(faiss_id), url, meta.get("url_key") or url, meta.get("timestamp"),
+                json.dumps(extra) if extra else None,
+            ))
+
+        if not items:
+            return
+
+        placeholders = ",".join("?" * len(items))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                previous = self._conn.execute(
+                    f"SELECT url FROM items WHERE id IN ({placeholders})", [i[0] for i in items]
+                ).fetchall()
+                self._conn.executemany(
+                    "INSERT INTO documents(url, title, text, provider) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET title=excluded.title, text=excluded.text, "
+                    "provider=excluded.provider",
+                    docs,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO items(id, url, url_key, timestamp, extra) VALUES (?, ?, ?, ?, ?)",
+                    items,
+                )
+                self._conn.executemany(
+                    "DELETE FROM documents WHERE url = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM items WHERE items.url = documents.url)",
+                    previous,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def touch(self, ids: Iterable[int], timestamp: int):
+        """Refresh the timestamp of existing items."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE items SET timestamp = ? WHERE id = ?",
+                [(timestamp, int(i)) for i in ids],
+            )
+
+    def record_hits(self, ids: Iterable[int], timestamp: int):
+        """Count a search hit for each id (drives LRU/LFU eviction)."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE items SET hits = hits + 1, last_hit = ? WHERE id = ?",
+                [(timestamp, int(i)) for i in ids],
+            )
+
+    def delete(self, ids: Iterable[int]):
+        """Remove items, and any document no longer referenced by an item."""
+        ids = [(int(i),) for i in ids]
+        if not ids:
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM items WHERE id = ?", ids)
+                self._conn.execute(
+                    "DELETE FROM documents WHERE url NOT IN (SELECT DISTINCT url FROM items)"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---------------- retention ----------------
+
+    def select_victims(
+        self,
+        now: int,
+        ttl_seconds: int = 0,
+        max_items: int = 0,
+        max_bytes: int = 0,
+        policy: str = "lru",
+    ) -> List[int]:
+        """
+        Ids to evict: everything older than ttl_seconds, then the coldest
+        items (by policy) until at most max_items remain and the stored text
+        fits in max_bytes. A limit of 0 disables that rule.
+        """
+        order = EVICTION_ORDER.get(policy)
+        if order is None:
+            raise ValueError(f"Unknown eviction policy {policy!r}")
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT i.id, i.timestamp, LENGTH(CAST(COALESCE(d.text, '') AS BLOB)) "
+                "FROM items i LEFT JOIN documents d ON d.url = i.url "
+                f"ORDER BY {order}"
+            ).fetchall()
+
+        victims = []
+        remaining = []
+        for faiss_id, ts, size in rows:
+            if ttl_seconds and ts is not None and ts < now - ttl_seconds:
+                victims.append(faiss_id)
+            else:
+                remaining.append((faiss_id, size or 0))
+
+        count = len(remaining)
+        total = sum(size for _, size in remaining)
+        for faiss_id, size in remaining:
+            over_items = max_items and count > max_items
+            over_bytes = max_bytes and total > max_bytes
+            if not (over_items or over_bytes):
+                break
+            victims.append(faiss_id)
+            count -= 1
+            total -= size
+
+        return victims
+
+    # ---------------- reads ----------------
+
+    def ids_for_keys(self, url_keys: Iterable[str]) -> Dict[str, int]:
+        """Canonical URL key -> id for the pages already in memory."""
+        url_keys = list(url_keys)
+        if not url_keys:
+            return {}
+
+        placeholders = ",".join("?" * len(url_keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT url_key, MIN(id) FROM items WHERE url_key IN ({placeholders}) GROUP BY url_key",
+                url_keys,
+            ).fetchall()
+        return {url_key: faiss_id for url_key, faiss_id in rows}
+
+    def max_id(self) -> int:
+        """Highest id in use, or -1 for an empty store."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM items").fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT i.id, i.url, i.timestamp, i.extra, d.title, d.text, d.provider "
+                "FROM items i LEFT JOIN documents d ON d.url = i.url "
+                f"WHERE i.id IN ({placeholders})",
+                ids,
+            ).fetchall()
+
+        out = {}
+        for faiss_id, url, ts, extra, title, text, provider in rows:
+            meta = json.loads(extra) if extra else {}
+            meta.update({
+                "title": title or "",
+                "url": url,
+                "provider": provider or "",
+                "text": text or "",
+                "timestamp": ts,
+            })
+            out[faiss_id] = meta
+        return out
+
+    def missing(self, ids: Iterable[int]) -> List[int]:
+        ids = [int(i) for i in ids]
+        found = self.get_many(ids)
+        return [i for i in ids if i not in found]
+
+    def iter_items(self, batch: int = 1000):
+        """Yield (id, metadata) for every item, batch rows at a time."""
+        last = -1
+        while True:
+            with self._lock:
+                ids = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM items WHERE id > ? ORDER BY id LIMIT ?", (last, batch)
+                )]
+            if not ids:
+                return
+            metas = self.get_many(ids)
+            for faiss_id in ids:
+                if faiss_id in metas:
+                    yield faiss_id, metas[faiss_id]
+            last = ids[-1]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    # ---------------- migration ----------------
+
+    def import_json(self, json_path: Path) -> int:
+        """One-off import of the legacy memory.json ({"<id>": metadata})."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        self.put_many((int(k), v) for k, v in legacy.items())
+        return len(legacy)
@@ -1,86 +1,745 @@
 import os
 import json
 import time
+import atexit
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import faiss
 import numpy as np
 from pathlib import Path
 from typing import Dict, Any, List, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from vector_memory.metadata_store import MetadataStore
+from vector_memory.locks import RWLock, FileLock
+from vector_memory.lexical_index import LexicalIndex
 
 BASE_DIR = Path(__file__).resolve().parent
 INDEX_PATH = BASE_DIR / "faiss_index.bin"
-MEMORY_PATH = BASE_DIR / "memory.json"
+MEMORY_PATH = BASE_DIR / "memory.json"       # legacy metadata, imported once
+DB_PATH = BASE_DIR / "memory.db"
+WAL_PATH = BASE_DIR / "memory.wal"
+LOCK_PATH = BASE_DIR / "memory.lock"
+LEXICAL_PATH = BASE_DIR / "lexical_index"
 
 EMBED_DIM = 384   # all-MiniLM-L6-v2 output size
 
+# Fold the write-ahead log into the index snapshot after this many records
+CHECKPOINT_EVERY = int(os.getenv("MEMORY_CHECKPOINT_EVERY", 500))
+
 # -------------------------
-# Load / Initialize FAISS
+# Retention (0 disables a limit)
+# -------------------------
+MAX_ITEMS = int(os.getenv("MEMORY_MAX_ITEMS", 0))
+MAX_BYTES = int(os.getenv("MEMORY_MAX_BYTES", 0))           # stored text bytes
+TTL_SECONDS = int(os.getenv("MEMORY_TTL_SECONDS", 0))
+EVICTION_POLICY = os.getenv("MEMORY_EVICTION_POLICY", "lru")  # lru | lfu
+COMPACT_INTERVAL = int(os.getenv("MEMORY_COMPACT_INTERVAL", 600))
+
 # -------------------------
-if INDEX_PATH.exists():
-    index = faiss.read_index(str(INDEX_PATH))
-else:
-    index = faiss.IndexFlatL2(EMBED_DIM)
+# Index backend
+# -------------------------
+# The store is exact (flat) while small and migrates to INDEX_TYPE once it
+# holds ANN_THRESHOLD vectors. "flat" disables migration.
+INDEX_TYPE = os.getenv("MEMORY_INDEX_TYPE", "hnsw")          # flat | hnsw | ivf | ivfpq
+ANN_THRESHOLD = int(os.getenv("MEMORY_ANN_THRESHOLD", 20000))
+
+HNSW_M = int(os.getenv("MEMORY_HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", 64))
+
+IVF_NLIST = int(os.getenv("MEMORY_IVF_NLIST", 0))           # 0 = 4 * sqrt(n)
+IVF_NPROBE = int(os.getenv("MEMORY_IVF_NPROBE", 16))
+PQ_M = int(os.getenv("MEMORY_PQ_M", 48))                    # sub-quantizers, must divide EMBED_DIM
+PQ_NBITS = int(os.getenv("MEMORY_PQ_NBITS", 8))
+
+# Click / campaign trackers that never change page content
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid",
+    "igshid", "mc_cid", "mc_eid", "_hsenc", "_hsmpl",
+}
+
+def canonical_url(url: str) -> str:
+    """
+    De-duplication key of a page in memory: lowercase scheme/host, no
+    fragment, no trailing slash, tracking parameters dropped and the rest
+    sorted. Parameters are compared as sent, never re-encoded. The original
+    URL is what gets stored and shown.
+    """
+    parts = urlsplit(url.strip())
+    query = sorted(
+        pair for pair in parts.query.split("&")
+        if pair and not _is_tracking(pair.split("=", 1)[0])
+    )
+    path = parts.path.rstrip("/") or ""
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, "&".join(query), ""))
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith("utm_")
+
+def _inner(idx):
+    """The wrapped index of an IndexIDMap2, or idx itself."""
+    if isinstance(idx, faiss.IndexIDMap2):
+        return faiss.downcast_index(idx.index)
+    return idx
+
+def index_kind(idx) -> str:
+    idx = _inner(idx)
+    if isinstance(idx, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(idx, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(idx, faiss.IndexIVFFlat):
+        return "ivf"
+    return "flat"
+
+def _ivf_nlist(n: int) -> int:
+    nlist = IVF_NLIST or int(4 * np.sqrt(n))
+    # k-means wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39))
+
+def min_training_points(kind: str) -> int:
+    """Vectors needed to train an index of this kind (0 = no training)."""
+    if kind == "ivf":
+        return 39
+    if kind == "ivfpq":
+        # every PQ sub-quantizer needs one point per centroid
+        return max(39, 2 ** PQ_NBITS)
+    return 0
+
+def apply_search_params(idx, nprobe: int = None, ef_search: int = None):
+    """Recall/latency knobs: nprobe for IVF indexes, efSearch for HNSW."""
+    idx = _inner(idx)
+    kind = index_kind(idx)
+    if kind == "hnsw":
+        idx.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    elif kind in ("ivf", "ivfpq"):
+        idx.nprobe = nprobe or IVF_NPROBE
+
+def build_index(kind: str, vectors: np.ndarray = None, ids: np.ndarray = None):
+    """
+    Create an index of the given kind, train it on vectors if needed and add
+    them. With ids, the index is wrapped in an IndexIDMap2 keyed by those ids.
+    """
+    n = 0 if vectors is None else len(vectors)
+
+    if kind == "flat":
+        idx = faiss.IndexFlatL2(EMBED_DIM)
+    elif kind == "hnsw":
+        idx = faiss.IndexHNSWFlat(EMBED_DIM, HNSW_M)
+        idx.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind in ("ivf", "ivfpq"):
+        if n == 0:
+            raise ValueError(f"{kind} index needs training vectors")
+        quantizer = faiss.IndexFlatL2(EMBED_DIM)
+        if kind == "ivf":
+            idx = faiss.IndexIVFFlat(quantizer, EMBED_DIM, _ivf_nlist(n))
+        else:
+            idx = faiss.IndexIVFPQ(quantizer, EMBED_DIM, _ivf_nlist(n), PQ_M, PQ_NBITS)
+        idx.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type {kind!r}")
+
+    apply_search_params(idx)
+    if ids is not None:
+        idx = faiss.IndexIDMap2(idx)
+        if n:
+            idx.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    elif n:
+        idx.add(vectors)
+    return idx
+
+def supports_remove(idx) -> bool:
+    # HNSW graphs can't delete, and IndexIDMap2.remove_ids over an IVF index
+    # reorders its lists out of step with the id map. Replaced vectors stay
+    # in both until the next rebuild.
+    return index_kind(idx) == "flat"
+
+def all_vectors(idx) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (ids, vectors) of everything stored in an IndexIDMap2. When an id was
+    re-added without removal (HNSW, IVF), the latest vector wins.
+    """
+    inner = _inner(idx)
+    if isinstance(inner, (faiss.IndexIVFFlat, faiss.IndexIVFPQ)):
+        inner.make_direct_map()
+    ids = faiss.vector_to_array(idx.id_map).astype("int64")
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+
+    last = {int(i): pos for pos, i in enumerate(ids)}
+    keep = sorted(last.values())
+    return ids[keep], vectors[keep]
 
 # -------------------------
-# Load / Initialize JSON metadata
+# Concurrency
 # -------------------------
-if MEMORY_PATH.exists():
-    with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-        memory: Dict[str, Any] = json.load(f)
-else:
-    memory = {}
+# - Searches hold _rw.read(); anything that mutates or swaps `index` holds
+#   _rw.write() for as short as possible.
+# - Writers (adds, checkpoints, migrations, compaction) are serialized by
+#   _writer(): a thread lock inside the process plus an exclusive flock on
+#   memory.lock across uvicorn workers. Only one writer at a time touches the
+#   WAL, the index snapshot or id allocation.
+# - Each process follows the others' writes: a new snapshot on disk is
+#   reloaded, and WAL bytes past what it has applied are replayed.
+_rw = RWLock()
+_write_lock = threading.Lock()
+_file_lock = FileLock(LOCK_PATH)
+_sync_lock = threading.Lock()
+
+@contextmanager
+def _writer():
+    load()
+    with _write_lock, _file_lock.exclusive():
+        _sync_locked()
+        yield
+
+def _file_state(path: Path) -> Tuple[int, int, int]:
+    """(mtime_ns, size, inode) of path, or zeros if it doesn't exist."""
+    try:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size, st.st_ino
+    except FileNotFoundError:
+        return 0, 0, 0
 
 # -------------------------
-# Save functions
+# Index snapshot on disk
 # -------------------------
+def _read_index_file():
+    """
+    Load faiss_index.bin. Vectors are keyed by metadata id through an
+    IndexIDMap2, so a page can be replaced in place instead of appended again.
+    """
+    if not INDEX_PATH.exists():
+        return build_index("flat", ids=np.zeros(0))
+
+    idx = faiss.read_index(str(INDEX_PATH))
+    if not isinstance(idx, faiss.IndexIDMap2):
+        # Legacy positional index: position == id
+        vectors = idx.reconstruct_n(0, idx.ntotal)
+        idx = build_index(index_kind(idx), vectors, np.arange(idx.ntotal))
+    apply_search_params(idx)
+    return idx
+
+def _atomic_write(path: Path, write):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
 def save_index():
-    faiss.write_index(index, str(INDEX_PATH))
+    global _index_state
 
-def save_memory():
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(memory, f, indent=2)
+    with _rw.read():
+        _atomic_write(INDEX_PATH, lambda p: faiss.write_index(index, str(p)))
+    _index_state = _file_state(INDEX_PATH)
 
 # -------------------------
-# Add new vector to memory
+# Metadata store + BM25 index (per process)
 # -------------------------
-def add_memory_item(vector: np.ndarray, metadata: Dict[str, Any]) -> int:
+# A SQLite connection must not be used across fork(), and with a pre-forking
+# server (gunicorn --preload) this module is imported in the master. Both
+# stores are opened on first use in each process instead of at import.
+_stores = None        # (pid, MetadataStore, LexicalIndex)
+_stores_lock = threading.Lock()
+_inherited = []       # a parent's handles: kept so they're never closed here
+
+def _open_stores():
+    global _stores
+
+    if _stores is not None:
+        _inherited.append(_stores)
+
+    fresh_db = not DB_PATH.exists()
+    memory = MetadataStore(DB_PATH)
+
+    if fresh_db and MEMORY_PATH.exists():
+        imported = memory.import_json(MEMORY_PATH)
+        MEMORY_PATH.rename(MEMORY_PATH.with_suffix(".json.imported"))
+        print(f"[memory] imported {imported} items from {MEMORY_PATH.name}")
+
+    # BM25 index over the same items, for hybrid retrieval
+    fresh_lexical = not LEXICAL_PATH.exists()
+    lexical = LexicalIndex(LEXICAL_PATH)
+
+    if fresh_lexical and memory.count():
+        with _file_lock.exclusive():
+            lexical.add_many(memory.iter_items())
+        print(f"[memory] built BM25 index over {lexical.doc_count()} items")
+
+    _stores = (os.getpid(), memory, lexical)
+
+def load():
     """
-    Adds a vector + metadata to memory. Returns FAISS ID.
+    Open this process's stores and load the index from disk, once per
+    process. Every entry point calls it before taking the file lock.
     """
-    global memory, index
+    if _stores is not None and _stores[0] == os.getpid():
+        return
+
+    with _stores_lock:
+        if _stores is not None and _stores[0] == os.getpid():
+            return
+        _open_stores()
+        with _sync_lock, _file_lock.shared():
+            _sync_locked()
+
+def _memory() -> MetadataStore:
+    load()
+    return _stores[1]
+
+def _lexical() -> LexicalIndex:
+    load()
+    return _stores[2]
+
+# -------------------------
+# Write-ahead log
+# -------------------------
+def _encode_record(faiss_id: int, vector: np.ndarray, metadata: Dict[str, Any]) -> str:
+    vec = base64.b64encode(np.ascontiguousarray(vector, dtype="float32").tobytes()).decode("ascii")
+    return json.dumps({"id": faiss_id, "vec": vec, "meta": metadata}) + "\n"
+
+def _set_vectors(ids: List[int], mat: np.ndarray):
+    """Insert or replace vectors by id (idempotent for removable indexes)."""
+    id_arr = np.asarray(ids, dtype="int64")
+    with _rw.write():
+        if supports_remove(index):
+            index.remove_ids(id_arr)
+        index.add_with_ids(mat, id_arr)
+
+def _append_wal(lines: List[str]):
+    """One write + fsync for the whole batch. Caller holds _writer()."""
+    global _wal_offset, _wal_state, wal_records
+
+    data = "".join(lines).encode("utf-8")
+    with open(WAL_PATH, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    _wal_offset += len(data)
+    _wal_state = _file_state(WAL_PATH)
+    wal_records += len(lines)
+
+def _apply_wal_tail():
+    """
+    Apply WAL records past _wal_offset. Records are set by id, so ones
+    already in the index snapshot are simply replaced; a torn final line is
+    left for the next call.
+    """
+    global _wal_offset, _wal_state, wal_records
+
+    _wal_state = _file_state(WAL_PATH)
+    if not WAL_PATH.exists():
+        return
+
+    with open(WAL_PATH, "rb") as f:
+        f.seek(_wal_offset)
+        data = f.read()
+
+    complete = data[:data.rfind(b"\n") + 1]
+    records = []
+    for line in complete.splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+
+    _wal_offset += len(complete)
+    wal_records += len(records)
+    if not records:
+        return
+
+    _set_vectors(
+        [rec["id"] for rec in records],
+        np.stack([np.frombuffer(base64.b64decode(rec["vec"]), dtype="float32") for rec in records]),
+    )
+    missing = set(_memory().missing(rec["id"] for rec in records))
+    recovered = [(rec["id"], rec["meta"]) for rec in records if rec["id"] in missing]
+    _memory().put_many(recovered)
+    try:
+        _lexical().add_many(recovered)
+    except Exception as e:
+        print(f"[memory] BM25 recovery failed: {e!r}")
+
+def _sync_locked():
+    """
+    Catch up with other processes. Caller holds the file lock (shared or
+    exclusive). A new snapshot or a new WAL file means a checkpoint happened:
+    reload the snapshot and replay the WAL from the start.
+    """
+    global index, _index_state, _wal_offset, wal_records
+
+    wal_inode = _file_state(WAL_PATH)[2]
+    if _file_state(INDEX_PATH) != _index_state or (_wal_state[2] and wal_inode != _wal_state[2]):
+        new_index = _read_index_file()
+        with _rw.write():
+            index = new_index
+        _index_state = _file_state(INDEX_PATH)
+        _wal_offset = 0
+        wal_records = 0
+
+    _apply_wal_tail()
+
+def _maybe_sync():
+    """
+    Cheap check on the read path: two stat() calls unless something changed.
+    Never waits on a writer; if one holds the lock, search the current index
+    and catch up on a later query.
+    """
+    load()
+    wal = _file_state(WAL_PATH)
+    if _file_state(INDEX_PATH) == _index_state and wal[2] == _wal_state[2] and wal[1] <= _wal_offset:
+        return
+
+    if not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        with _file_lock.shared(blocking=False) as locked:
+            if locked:
+                _sync_locked()
+    finally:
+        _sync_lock.release()
+
+# -------------------------
+# Load / Initialize FAISS
+# -------------------------
+index = faiss.IndexIDMap2(faiss.IndexFlatL2(EMBED_DIM))
+_index_state = (-1, -1, -1)   # forces the initial load
+_wal_state = (0, 0, 0)
+_wal_offset = 0
+wal_records = 0   # records in the WAL since the last checkpoint
 
-    if vector.shape != (EMBED_DIM,):
-        raise ValueError(f"Expected vector shape {(EMBED_DIM,)}, got {vector.shape}")
 
-    faiss_id = index.ntotal
-    index.add(np.array([vector]).astype("float32"))
+# -------------------------
+# Checkpoint / migration
+# -------------------------
+def _checkpoint_locked(force: bool = False):
+    global _wal_offset, _wal_state, wal_records
 
-    metadata["timestamp"] = int(time.time())
-    memory[str(faiss_id)] = metadata
+    if wal_records == 0 and not force:
+        return
 
     save_index()
-    save_memory()
+    if WAL_PATH.exists():
+        WAL_PATH.unlink()
+    _wal_offset = 0
+    _wal_state = (0, 0, 0)
+    wal_records = 0
+
+def checkpoint(force: bool = False):
+    """
+    Persist the index snapshot and truncate the WAL (metadata is already
+    durable in SQLite). Called every CHECKPOINT_EVERY records, after
+    evictions and on shutdown.
+    """
+    if _stores is None or _stores[0] != os.getpid():
+        return   # nothing was loaded or written in this process
+    with _writer():
+        _checkpoint_locked(force)
+
+atexit.register(checkpoint)
+
+_migrate_at = 0   # raised after a failed migration
+
+def _maybe_migrate_locked() -> bool:
+    """
+    Rebuild the flat index as INDEX_TYPE once it passes ANN_THRESHOLD (and
+    holds enough vectors to train it). Returns True if a migration happened.
+    Readers keep using the old index until the new one is swapped in. A
+    failed build is logged and retried once the index has doubled; memory
+    stays on the flat index meanwhile.
+    """
+    global index, _migrate_at
+
+    threshold = max(ANN_THRESHOLD, min_training_points(INDEX_TYPE), _migrate_at)
+    if INDEX_TYPE == "flat" or index_kind(index) != "flat" or index.ntotal < threshold:
+        return False
+
+    start = time.perf_counter()
+    with _rw.read():
+        ids, vectors = all_vectors(index)
+    try:
+        new_index = build_index(INDEX_TYPE, vectors, ids)
+    except Exception as e:
+        _migrate_at = 2 * len(vectors)
+        print(f"[memory] migration to {INDEX_TYPE} failed, staying flat until {_migrate_at} vectors: {e!r}")
+        return False
+    with _rw.write():
+        index = new_index
+    _checkpoint_locked(force=True)
+    print(f"[memory] migrated {len(vectors)} vectors to {INDEX_TYPE} in {time.perf_counter() - start:.2f}s")
+    return True
+
+def set_search_params(nprobe: int = None, ef_search: int = None):
+    """Retune the live index at runtime."""
+    with _rw.write():
+        apply_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+# -------------------------
+# Add new vectors to memory
+# -------------------------
+def add_memory_items(vectors: List[np.ndarray], metadatas: List[Dict[str, Any]]) -> List[int]:
+    """
+    Upsert a batch of vectors + metadata keyed by canonical URL (stored as
+    "url_key"; "url" keeps the original link). A page already in memory keeps
+    its id: its timestamp is refreshed and, if its text changed, its vector
+    is replaced. Returns the FAISS IDs.
+
+    New and changed vectors go to the WAL in a single append and metadata in
+    a single transaction.
+    """
+    if not vectors:
+        return []
 
-    return faiss_id
+    mat = np.asarray(vectors, dtype="float32")
+    if mat.ndim != 2 or mat.shape[1] != EMBED_DIM:
+        raise ValueError(f"Expected vectors of shape (n, {EMBED_DIM}), got {mat.shape}")
+
+    now = int(time.time())
+
+    # Last occurrence of a page within the batch wins
+    batch: Dict[str, Tuple[np.ndarray, Dict[str, Any]]] = {}
+    for vec, metadata in zip(mat, metadatas):
+        metadata["url_key"] = canonical_url(metadata.get("url", ""))
+        metadata["timestamp"] = now
+        batch[metadata["url_key"]] = (vec, metadata)
+
+    with _writer():
+        existing = _memory().ids_for_keys(batch.keys())
+        stored = _memory().get_many(existing.values())
+        next_id = _memory().max_id() + 1
+
+        ids, write_ids, write_vecs, write_metas, touched = [], [], [], [], []
+        for url_key, (vec, metadata) in batch.items():
+            faiss_id = existing.get(url_key)
+            if faiss_id is None:
+                faiss_id = next_id
+                next_id += 1
+            elif stored.get(faiss_id, {}).get("text") == metadata.get("text", ""):
+                # Same page, same content: only refresh the timestamp
+                touched.append(faiss_id)
+                ids.append(faiss_id)
+                continue
+
+            ids.append(faiss_id)
+            write_ids.append(faiss_id)
+            write_vecs.append(vec)
+            write_metas.append(metadata)
+
+        if write_ids:
+            _append_wal([_encode_record(i, v, m) for i, v, m in zip(write_ids, write_vecs, write_metas)])
+            _set_vectors(write_ids, np.stack(write_vecs))
+            _memory().put_many(zip(write_ids, write_metas))
+            _lexical().add_many(zip(write_ids, write_metas))
+
+        if touched:
+            _memory().touch(touched, now)
+
+        if wal_records >= CHECKPOINT_EVERY:
+            _checkpoint_locked()
+        _maybe_migrate_locked()
+
+    return ids
+
+def add_memory_item(vector: np.ndarray, metadata: Dict[str, Any]) -> int:
+    """
+    Adds a vector + metadata to memory. Returns FAISS ID.
+    """
+    if vector.shape != (EMBED_DIM,):
+        raise ValueError(f"Expected vector shape {(EMBED_DIM,)}, got {vector.shape}")
+
+    return add_memory_items([vector], [metadata])[0]
 
 # -------------------------
 # Search top-K from memory
 # -------------------------
-def search_memory(query_vec: np.ndarray, top_k: int = 5) -> List[Tuple[int, float, Dict]]:
+def search_memory(query_vec: np.ndarray, top_k: int = 5, record_hits: bool = True) -> List[Tuple[int, float, Dict]]:
     """
     Returns list of (faiss_id, distance, metadata)
     """
-    if index.ntotal == 0:
-        return []
+    _maybe_sync()
 
     query_vec = np.array([query_vec]).astype("float32")
 
-    distances, idxs = index.search(query_vec, top_k)
+    with _rw.read():
+        if index.ntotal == 0:
+            return []
+        distances, idxs = index.search(query_vec, top_k)
+    now = int(time.time())
 
-    results = []
+    hits, seen = [], set()
     for dist, idx in zip(distances[0], idxs[0]):
-        if idx == -1:
+        # HNSW and IVF indexes can hold a replaced vector under the same id
+        if idx == -1 or idx in seen:
             continue
-        if str(idx) in memory:
-            results.append((idx, float(dist), memory[str(idx)]))
+        seen.add(idx)
+        hits.append((int(idx), float(dist)))
+    metas = _memory().get_many(idx for idx, _ in hits)
+
+    # Expired items are hidden right away, even before compaction drops them
+    results = [
+        (idx, dist, metas[idx]) for idx, dist in hits
+        if idx in metas and not (TTL_SECONDS and (metas[idx]["timestamp"] or 0) < now - TTL_SECONDS)
+    ]
+    if record_hits:
+        _memory().record_hits((idx for idx, _, _ in results), now)
 
     return results
+
+# -------------------------
+# Hybrid (BM25 + dense) search
+# -------------------------
+RRF_K = int(os.getenv("MEMORY_RRF_K", 60))
+
+_hybrid_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-hybrid")
+
+def reciprocal_rank_fusion(*rankings: List[int], k: int = RRF_K) -> Dict[int, float]:
+    """sum over rankings of 1 / (k + rank), rank starting at 1."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, faiss_id in enumerate(ranking, 1):
+            fused[faiss_id] = fused.get(faiss_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+def search_memory_hybrid(
+    query_text: str, query_vec: np.ndarray, top_k: int = 5
+) -> List[Tuple[int, float, Dict, Dict[str, Any]]]:
+    """
+    Run BM25 and FAISS retrieval side by side and fuse them with reciprocal
+    rank fusion. Returns (faiss_id, rrf_score, metadata, signals) best first;
+    signals holds the dense "distance" and lexical "bm25" score, each None
+    when that retriever didn't return the item.
+
+    Hits are not recorded here: the caller passes the ids it actually serves
+    to record_hits(), so rejected candidates don't look recently used.
+    """
+    depth = max(top_k * 4, 20)
+
+    lexical_future = _hybrid_pool.submit(_lexical().search, query_text, depth)
+    dense = search_memory(query_vec, top_k=depth, record_hits=False)
+    try:
+        lexical_hits = lexical_future.result()
+    except Exception as e:
+        print(f"[memory] BM25 search failed: {e!r}")
+        lexical_hits = []
+
+    distance = {idx: dist for idx, dist, _ in dense}
+    bm25 = dict(lexical_hits)
+    metas = {idx: meta for idx, _, meta in dense}
+
+    fused = reciprocal_rank_fusion([idx for idx, _, _ in dense], [idx for idx, _ in lexical_hits])
+    top = sorted(fused, key=fused.get, reverse=True)
+
+    # Lexical-only hits still need their metadata (and TTL filtering)
+    need = [idx for idx in top if idx not in metas]
+    if need:
+        now = int(time.time())
+        for idx, meta in _memory().get_many(need).items():
+            if not (TTL_SECONDS and (meta["timestamp"] or 0) < now - TTL_SECONDS):
+                metas[idx] = meta
+
+    results = [
+        (idx, fused[idx], metas[idx], {"distance": distance.get(idx), "bm25": bm25.get(idx)})
+        for idx in top if idx in metas
+    ][:top_k]
+
+    return results
+
+def record_hits(ids: List[int]):
+    """Count a served hit for each id (drives LRU/LFU eviction)."""
+    if ids:
+        _memory().record_hits(ids, int(time.time()))
+
+# -------------------------
+# Retention / compaction
+# -------------------------
+def _rebuild_without(victims: set):
+    """
+    Rebuild the index from its current vectors minus victims, off to the
+    side, then swap it in. Caller holds _writer(), so no write can land in
+    between; searches keep running against the old index meanwhile.
+    """
+    global index
+
+    with _rw.read():
+        ids, vectors = all_vectors(index)
+        kind = index_kind(index)
+
+    keep = np.array([int(i) not in victims for i in ids], dtype=bool)
+    if not keep.any():
+        new_index = build_index("flat", ids=np.zeros(0))
+    else:
+        # Too few vectors left to retrain IVF / IVF-PQ: go back to flat and
+        # let migration pick it up again once the store has grown
+        if keep.sum() < min_training_points(kind):
+            kind = "flat"
+        new_index = build_index(kind, vectors[keep], ids[keep])
+
+    with _rw.write():
+        index = new_index
+
+def compact() -> Dict[str, Any]:
+    """
+    Apply TTL, capacity and byte limits: evicted items disappear from the
+    metadata store immediately; their vectors are removed in place from a
+    flat index, or by a rebuild for indexes that can't delete (HNSW, IVF).
+    """
+    start = time.perf_counter()
+
+    with _writer():
+        victims = _memory().select_victims(
+            int(time.time()),
+            ttl_seconds=TTL_SECONDS,
+            max_items=MAX_ITEMS,
+            max_bytes=MAX_BYTES,
+            policy=EVICTION_POLICY,
+        )
+
+        # HNSW and IVF also accumulate replaced vectors; rebuild when they pile up
+        stale = index.ntotal - _memory().count() if not supports_remove(index) else 0
+
+        if not victims and stale <= 0.1 * max(index.ntotal, 1):
+            return {"evicted": 0, "rebuilt": False}
+
+        _memory().delete(victims)
+        _lexical().delete(victims)
+
+        rebuilt = not supports_remove(index)
+        if rebuilt:
+            _rebuild_without(set(victims))
+        elif victims:
+            with _rw.write():
+                index.remove_ids(np.asarray(victims, dtype="int64"))
+
+        # Evicted ids must not come back from WAL replay
+        _checkpoint_locked(force=True)
+
+    stats = {
+        "evicted": len(victims),
+        "rebuilt": rebuilt,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    print(f"[memory] compaction: {stats}")
+    return stats
+
+_compactor = None
+
+def start_compactor(interval: int = COMPACT_INTERVAL):
+    """Run compact() every interval seconds on a daemon thread."""
+    global _compactor
+
+    if _compactor is not None or interval <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                compact()
+            except Exception as e:
+                print(f"[memory] compaction failed: {e!r}")
+
+    _compactor = threading.Thread(target=loop, name="memory-compactor", daemon=True)
+    _compactor.start()